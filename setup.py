@@ -67,8 +67,14 @@ def iniciar():
     #python_executable = listar_interpretes_python()
 
     pip_updater = PipUpdater()
+    # Con un directorio de ruedas (WHEELHOUSE, por defecto ./wheelhouse) pip
+    # lo usa además de PyPI; con INSTALL_OFFLINE=1, solo ese directorio.
+    dependency_installer = PipDependencyInstaller(
+        wheelhouse=os.getenv("WHEELHOUSE", "wheelhouse"),
+        offline=os.getenv("INSTALL_OFFLINE") == "1",
+    )
     installer_manager = DependencyInstallerManager(
-        PipDependencyInstaller(), pip_updater, max_retries=3
+        dependency_installer, pip_updater, max_retries=3
     )
 
     #actualizar_pip(pip_updater)
@@ -0,0 +1,283 @@
+"""
+analytics.py
+Streaming statistics and exports over the question/answer history.
+
+Records are read one at a time and every aggregate is bounded, so memory stays
+constant however large the history is: the busiest users and the most asked
+questions are tracked with Space-Saving sketches of fixed capacity, answer
+lengths with a fixed-bucket histogram and volumes with one counter per day.
+
+Reading does not get in the bot's way. The JSON-lines log is only opened for
+reading, which never blocks the ``O_APPEND`` writes of the bot, and records
+appended during the scan may or may not be included. The SQLite backend reads
+through its own connection, a WAL snapshot that does not block the writer.
+"""
+
+import csv
+import gzip
+import heapq
+import itertools
+import json
+from pathlib import Path
+
+from . import storage
+from .answer_cache import normalize_question
+from .metrics import Histogram
+
+# Upper bounds, in characters, of the answer length histogram buckets.
+LENGTH_BUCKETS = (50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+RECORD_FIELDS = ("timestamp", "telegram_id", "username", "question", "answer", "assistant_id")
+ROW_FIELDS = ("section", "key", "label", "count", "error")
+
+
+class SpaceSaving:
+    """Approximate counts of the most frequent keys of a stream in ``capacity`` slots.
+
+    Implements Metwally et al.'s Space-Saving: a key that is not tracked when
+    every slot is taken replaces the key with the lowest count and inherits
+    that count, which becomes its maximum overestimation (``error``). Every key
+    more frequent than ``total / capacity`` is guaranteed to be tracked, and as
+    long as no key was evicted the counts are exact.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.total = 0
+        self.evictions = 0
+        self._counts = {}    # key -> [count, error]
+        # (count, sequence, key) for every tracked key. Counts only grow, so a
+        # stale entry is a lower bound and is refreshed when it reaches the top.
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, key, weight=1):
+        """Counts ``key``.
+
+        :return: The key it evicted, or None.
+        """
+        self.total += weight
+        entry = self._counts.get(key)
+        if entry is not None:
+            entry[0] += weight
+            return None
+        if len(self._counts) < self.capacity:
+            self._counts[key] = [weight, 0]
+            heapq.heappush(self._heap, (weight, next(self._sequence), key))
+            return None
+        while True:
+            count, _, evicted = self._heap[0]
+            current = self._counts[evicted][0]
+            if current == count:
+                break
+            heapq.heapreplace(self._heap, (current, next(self._sequence), evicted))
+        del self._counts[evicted]
+        heapq.heapreplace(self._heap, (count + weight, next(self._sequence), key))
+        self._counts[key] = [count + weight, count]
+        self.evictions += 1
+        return evicted
+
+    @property
+    def exact(self) -> bool:
+        """Tells whether every count is exact (no key was ever evicted)."""
+        return not self.evictions
+
+    def top(self, n=None) -> list:
+        """Returns ``(key, count, error)`` for the ``n`` highest counts (all if None)."""
+        items = ((key, count, error) for key, (count, error) in self._counts.items())
+        if n is None:
+            return sorted(items, key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(n, items, key=lambda item: item[1])
+
+
+class HistoryStats:
+    """Aggregates question/answer records in constant memory."""
+
+    def __init__(self, user_capacity=100000, question_capacity=1000):
+        self.records = 0
+        self.first = self.last = None
+        self.users = SpaceSaving(user_capacity)
+        self.usernames = {}    # telegram_id -> last username, for tracked users
+        self.questions = SpaceSaving(question_capacity)
+        self.answer_lengths = Histogram(LENGTH_BUCKETS)
+        self.longest_answer = 0
+        self.daily = {}        # ISO date -> records
+
+    def add(self, record) -> None:
+        """Counts one record."""
+        self.records += 1
+        timestamp = str(record.get("timestamp") or "")
+        if timestamp:
+            self.first = timestamp if self.first is None else min(self.first, timestamp)
+            self.last = timestamp if self.last is None else max(self.last, timestamp)
+            day = timestamp[:10]
+            self.daily[day] = self.daily.get(day, 0) + 1
+
+        user = record.get("telegram_id")
+        evicted = self.users.add(user)
+        if evicted is not None:
+            self.usernames.pop(evicted, None)
+        if record.get("username"):
+            self.usernames[user] = record["username"]
+
+        question = normalize_question(record.get("question") or "")
+        if question:
+            self.questions.add(question)
+
+        length = len(record.get("answer") or "")
+        self.answer_lengths.observe(length)
+        self.longest_answer = max(self.longest_answer, length)
+
+    def rows(self, top=20):
+        """Yields the results as flat rows with the ``ROW_FIELDS`` keys.
+
+        The users and questions sections hold the ``top`` highest counts (all
+        tracked ones if None); ``error`` is the maximum overestimation of a count.
+        """
+        for user, count, error in self.users.top(top):
+            yield {"section": "users", "key": user, "label": self.usernames.get(user, ""),
+                   "count": count, "error": error}
+        for question, count, error in self.questions.top(top):
+            yield {"section": "questions", "key": question, "label": "",
+                   "count": count, "error": error}
+        bounds = self.answer_lengths.bounds
+        for index, count in enumerate(self.answer_lengths.counts):
+            key = f"<={bounds[index]}" if index < len(bounds) else f">{bounds[-1]}"
+            yield {"section": "answer_length", "key": key, "label": "",
+                   "count": count, "error": 0}
+        for day in sorted(self.daily):
+            yield {"section": "daily", "key": day, "label": "",
+                   "count": self.daily[day], "error": 0}
+
+    def summary(self) -> dict:
+        """Returns the totals of the history."""
+        lengths = self.answer_lengths
+        return {
+            "records": self.records,
+            "first": self.first,
+            "last": self.last,
+            "users_tracked": len(self.users),
+            "users_exact": self.users.exact,
+            "questions_tracked": len(self.questions),
+            "questions_exact": self.questions.exact,
+            "answer_length_mean": round(lengths.sum / lengths.count, 1) if lengths.count else None,
+            "answer_length_p50": lengths.quantile(0.50),
+            "answer_length_p95": lengths.quantile(0.95),
+            "answer_length_max": self.longest_answer,
+            "days": len(self.daily),
+        }
+
+
+def iter_history(paths=None):
+    """Yields the stored records one at a time.
+
+    :param paths: History files to read in order: JSON-lines logs, rotated
+        ``.gz`` logs or a legacy JSON array. Without paths, the records of the
+        configured storage backend.
+    """
+    if not paths:
+        yield from storage.get_storage().iter_records()
+        return
+    for path in paths:
+        if str(path).endswith(".gz"):
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        else:
+            yield from storage.load_records(path)
+
+
+def select(records, since=None, until=None, telegram_id=None):
+    """Filters records by date, inclusive ISO dates, and user."""
+    for record in records:
+        day = str(record.get("timestamp") or "")[:10]
+        if since is not None and day < since:
+            continue
+        if until is not None and day > until:
+            continue
+        if telegram_id is not None and record.get("telegram_id") != telegram_id:
+            continue
+        yield record
+
+
+class ChunkedWriter:
+    """Writes rows to CSV or JSON-lines files of at most ``chunk_size`` rows.
+
+    With a ``chunk_size`` of 0 everything goes to ``path``; otherwise the parts
+    are named after it, ``export.csv`` becoming ``export-00001.csv``, ... Rows
+    are buffered and written ``batch_size`` at a time.
+    """
+
+    def __init__(self, path, fields, fmt=None, chunk_size=0, batch_size=1000):
+        self.path = Path(path)
+        self.fields = fields
+        self.format = fmt or ("csv" if self.path.suffix == ".csv" else "jsonl")
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.files = []
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._in_chunk = 0
+        self._batch = []
+
+    def _open(self) -> None:
+        if self.chunk_size:
+            path = self.path.with_name(f"{self.path.stem}-{len(self.files) + 1:05d}{self.path.suffix}")
+        else:
+            path = self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        if self.format == "csv":
+            self._writer = csv.DictWriter(self._file, self.fields, extrasaction="ignore")
+            self._writer.writeheader()
+        self.files.append(path)
+        self._in_chunk = 0
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        if self.format == "csv":
+            self._writer.writerows(self._batch)
+        else:
+            self._file.write("".join(
+                json.dumps({f: row.get(f) for f in self.fields}, ensure_ascii=False) + "\n"
+                for row in self._batch
+            ))
+        self._batch.clear()
+
+    def write(self, row) -> None:
+        """Adds one row, starting a new part when the current one is full."""
+        if self._file is None or (self.chunk_size and self._in_chunk >= self.chunk_size):
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+            self._open()
+        self._batch.append(row)
+        self._in_chunk += 1
+        self.rows += 1
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def close(self) -> list:
+        """Writes what is buffered and returns the paths of the files written."""
+        if self._file is None:
+            self._open()
+        self._flush()
+        self._file.close()
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            self._file.close()
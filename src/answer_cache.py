@@ -0,0 +1,114 @@
+"""
+answer_cache.py
+LRU + TTL cache of answers keyed by assistant and normalized question.
+"""
+
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .config import answer_cache_size, answer_cache_ttl
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Replies the handlers send when the assistant fails. They are stored in the
+# history like any answer but must never be served from it.
+TOO_SLOW = "Sorry, the response took too long."
+NO_VALID_RESPONSE = "Sorry, I couldn't get a valid response."
+RETRIEVAL_ERROR = "Sorry, an error occurred while retrieving the answer."
+# Reply while the circuit breaker is open and OpenAI is not contacted.
+UNAVAILABLE = "The assistant is temporarily unavailable. Please try again in a few minutes."
+FALLBACK_ANSWERS = frozenset({TOO_SLOW, NO_VALID_RESPONSE, RETRIEVAL_ERROR, UNAVAILABLE})
+
+
+def normalize_question(text) -> str:
+    """Normalizes a question so trivially different spellings share a cache entry.
+
+    Case is folded, punctuation is dropped and runs of whitespace collapse to a
+    single space: "What are your hours?" and "what are  your HOURS" match.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith("P"))
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class AnswerCache:
+    """Bounded answer cache with least-recently-used eviction and per-entry expiry.
+
+    Keys include the assistant id, so answers produced by one assistant are
+    never served for another one after ``ASSISTANT_ID`` changes.
+    """
+
+    def __init__(self, max_size=answer_cache_size, ttl=answer_cache_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # (assistant_id, normalized question) -> (answer, expires at)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, assistant, question, now=None):
+        """Returns the cached answer, or None on a miss or an expired entry."""
+        if not self.max_size:
+            return None
+        key = (assistant, normalize_question(question))
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = time.monotonic() if now is None else now
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, assistant, question, answer, now=None) -> None:
+        """Stores an answer, evicting the least recently used entry when full."""
+        if not self.max_size:
+            return
+        key = (assistant, normalize_question(question))
+        if not key[1]:
+            return
+        now = time.monotonic() if now is None else now
+        self._entries[key] = (answer, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def warm(self, records, assistant) -> int:
+        """Fills the cache from stored question/answer records.
+
+        Records are expected oldest first, so the newest answer to a question
+        wins. Records tagged with a different ``assistant_id`` are skipped;
+        records without one (written before the tag existed) are attributed to
+        ``assistant``.
+
+        :return: Number of records loaded.
+        """
+        loaded = 0
+        for record in records:
+            if record.get("assistant_id") not in (assistant, None):
+                continue
+            question, answer = record.get("question"), record.get("answer")
+            if question and answer and answer not in FALLBACK_ANSWERS:
+                self.put(assistant, question, answer)
+                loaded += 1
+        return loaded
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
+answer_cache = AnswerCache()
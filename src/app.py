@@ -0,0 +1,109 @@
+"""
+app.py
+Assembly of the bot: the Telegram application, its handlers and the start-up
+and shutdown of the background services.
+"""
+import asyncio
+import logging
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from .answer_cache import answer_cache
+from .config import (
+    telegram_token, max_concurrent_updates, assistant_id, answer_cache_warm_file,
+    similarity_matching, metrics_host, metrics_port, work_queue_max_depth,
+    debounce_window,
+)
+from .counter import message_counter
+from .debounce import message_debouncer
+from . import handlers
+from .handlers import start, help_command, reset_command, stats_command, process_message
+from .http_clients import create_telegram_request, prewarm
+from .metrics import metrics, MetricsServer
+from .quota import quota_manager
+from .similarity import similarity_index
+from .storage import get_storage, load_records
+from .thread_store import thread_store
+from .update_processor import PerChatUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+metrics_server = MetricsServer(metrics, metrics_host, metrics_port) if metrics_port else None
+
+
+async def on_startup(app):
+    """Starts background services once the event loop is running."""
+    await get_storage().start()
+    await message_counter.start()
+    await quota_manager.start()
+    await thread_store.start()
+    await prewarm(app.bot, handlers.client)
+    if metrics_server is not None:
+        await metrics_server.start()
+    if answer_cache_warm_file:
+        loaded = answer_cache.warm(load_records(answer_cache_warm_file), assistant_id)
+        logger.info("Answer cache warmed with %d records from %s.", loaded, answer_cache_warm_file)
+    if similarity_matching:
+        # Indexing a large history takes a while; do it off the event loop while
+        # the bot already serves messages.
+        app.create_task(build_similarity_index())
+
+
+async def build_similarity_index():
+    """Indexes the stored Q&A history for near-duplicate matching."""
+    indexed = await asyncio.to_thread(
+        similarity_index.build, get_storage().iter_records(), assistant_id
+    )
+    logger.info("Similarity index built with %d records.", indexed)
+
+
+async def on_shutdown(app):
+    """Stops background services, flushing pending writes."""
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await thread_store.stop()
+    await quota_manager.stop()
+    await message_counter.stop()
+    await get_storage().stop()
+
+
+def create_update_processor():
+    """Returns the processor running the handlers.
+
+    Only ``max_concurrent_updates`` messages are answered at a time, by the work
+    queue in ``process_message``. The processor lets enough handlers run for
+    those, the ones waiting in the work queue, and as many again for quick
+    replies, so excess messages reach ``process_message`` and are turned away
+    there instead of piling up unseen in the processor. With a debounce window,
+    quick consecutive messages of a chat are merged before reaching the handlers.
+    """
+    return PerChatUpdateProcessor(
+        2 * max_concurrent_updates + work_queue_max_depth,
+        debouncer=message_debouncer if debounce_window > 0 else None,
+    )
+
+
+def setup_handlers(app):
+    """Sets up the command and message handlers for the bot."""
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("reset", reset_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
+
+
+def build_application() -> Application:
+    """Builds the bot's application, with its handlers and the OpenAI client.
+
+    Nothing is contacted or written until the application is initialized.
+    """
+    handlers.init_client()
+    application = (
+        Application.builder()
+        .token(telegram_token)
+        .request(create_telegram_request())
+        .concurrent_updates(create_update_processor())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    setup_handlers(application)
+    return application
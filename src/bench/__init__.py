@@ -0,0 +1,5 @@
+"""
+bench
+Offline load test of the message pipeline against in-process fakes of the
+OpenAI Assistants API and the Telegram Bot API. Run with ``python -m src.bench``.
+"""
@@ -0,0 +1,356 @@
+"""
+bench/__main__.py
+Load test of process_message with simulated users and fake backends.
+
+Usage::
+
+    python -m src.bench [--users 50] [--messages 10] [--run-latency 1.0] [--json]
+    python -m src.bench --save baseline.json
+    python -m src.bench --baseline baseline.json --max-regression 0.1
+    python -m src.bench --webhook
+
+Each simulated user sends ``--messages`` questions one after the other,
+waiting for the answer before the next one. Updates go through the bot's real
+Application, handlers and update processor, and with ``--webhook`` they are
+POSTed to the webhook listener over localhost first; only the remote services
+are faked. No
+request leaves the process and every state file is written to a temporary
+directory, so the benchmark can run anywhere, including CI.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentile(ordered, q):
+    """Returns the ``q`` quantile of an already sorted list (nearest rank)."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MiB, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def prepare_environment(args, workdir) -> None:
+    """Points the bot's configuration at the fakes and a scratch directory.
+
+    Must run before anything under ``src`` reads ``src.config``.
+    """
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:BENCH",
+        "CLIENT_API_KEY": "sk-bench",
+        "ASSISTANT_ID": "asst_bench",
+        "QA_LOG_FILE": os.path.join(workdir, "questions_answers.jsonl"),
+        "MESSAGE_COUNT_FILE": os.path.join(workdir, "message_count.json"),
+        "SQLITE_PATH": os.path.join(workdir, "conversations.db"),
+        "STORAGE_BACKEND": args.storage,
+        "THREAD_STORE_FILE": os.path.join(workdir, "threads.json"),
+        "QUOTA_STATE_FILE": os.path.join(workdir, "quota_state.json"),
+        "STREAMING_ENABLED": "true" if args.streaming else "false",
+        "ANSWER_CACHE_WARM_FILE": "",
+        "METRICS_PORT": "0",
+    })
+    if not args.quota:
+        os.environ["USER_QUOTA_PER_MINUTE"] = "1000000"
+        os.environ["USER_QUOTA_BURST"] = "1000000"
+    os.environ["DAILY_MESSAGE_LIMIT"] = str(10 ** 9)
+
+
+def make_update(update_id, user_id, text) -> dict:
+    """Builds the update Telegram would send for a private text message."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User",
+                     "username": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+class WebhookClient:
+    """Delivers updates to the webhook listener over one keep-alive connection."""
+
+    def __init__(self, port, path, secret_token):
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self._reader = self._writer = None
+
+    async def post(self, update) -> None:
+        """POSTs an update and waits for the 200."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection("127.0.0.1", self.port)
+        body = json.dumps(update).encode()
+        self._writer.write(
+            f"POST {self.path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+            "Content-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {self.secret_token}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await self._writer.drain()
+        status = await self._reader.readline()
+        length = 0
+        while (line := await self._reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        await self._reader.readexactly(length)
+        if b" 200 " not in status:
+            raise RuntimeError(f"Webhook answered {status.decode().strip()}")
+
+    def close(self) -> None:
+        """Closes the connection."""
+        if self._writer is not None:
+            self._writer.close()
+
+
+async def run_benchmark(args) -> dict:
+    """Runs the load test and returns the measurements."""
+    # pylint: disable=import-outside-toplevel
+    from telegram import Update
+    from telegram.ext import Application, MessageHandler, filters
+    from src import app as app_module, handlers
+    from src.bot import bootstrap
+    from src.metrics import metrics
+    from src.webhook import WebhookServer
+    from .fakes import FakeAssistants, FakeBot, FakeOpenAI, Latency
+
+    bootstrap()
+    if not args.verbose:
+        for name in ("src", "telegram", "httpx"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    api = FakeAssistants(
+        api_latency=Latency(args.api_latency, args.api_sigma, rng),
+        run_latency=Latency(args.run_latency, args.run_sigma, rng),
+        error_rate=args.error_rate,
+        failure_rate=args.failure_rate,
+        rng=rng,
+        faults=args.faults.split(",") if args.faults else (),
+    )
+    handlers.client = FakeOpenAI(api)
+    fake_bot = FakeBot(Latency(args.telegram_latency, args.telegram_sigma, rng))
+
+    app = (
+        Application.builder()
+        .bot(fake_bot)
+        .concurrent_updates(app_module.create_update_processor())
+        .build()
+    )
+    app_module.setup_handlers(app)
+
+    loop = asyncio.get_running_loop()
+    pending = {}
+
+    async def done(update, context):  # pylint: disable=unused-argument
+        future = pending.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(loop.time())
+
+    # Handlers of a later group run after process_message has returned, also
+    # when it raised.
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, done), group=1)
+
+    common = [f"Common question number {i}?" for i in range(args.common_pool)]
+    update_ids = iter(range(1, 10 ** 9))
+    latencies = []
+
+    server = None
+    if args.webhook:
+        server = WebhookServer(app, host="127.0.0.1", port=0, secret_token="bench")
+
+    async def user(user_id):
+        client = WebhookClient(server.port, server.path, "bench") if server else None
+        try:
+            for i in range(args.messages):
+                if common and rng.random() < args.repeat:
+                    text = rng.choice(common)
+                else:
+                    text = f"Question {i} from user {user_id}?"
+                update_id = next(update_ids)
+                future = pending[update_id] = loop.create_future()
+                sent = loop.time()
+                update = make_update(update_id, user_id, text)
+                if client is not None:
+                    await client.post(update)
+                else:
+                    await app.update_queue.put(Update.de_json(update, fake_bot))
+                latencies.append(await future - sent)
+        finally:
+            if client is not None:
+                client.close()
+
+    await app.initialize()
+    await app_module.on_startup(app)
+    await app.start()
+    if server is not None:
+        await server.start()
+    started = loop.time()
+    try:
+        await asyncio.gather(*(user(1000 + u) for u in range(args.users)))
+    finally:
+        wall = loop.time() - started
+        if server is not None:
+            await server.stop()
+        await app.stop()
+        await app_module.on_shutdown(app)
+        await app.shutdown()
+
+    latencies.sort()
+    events = metrics.events
+    return {
+        "users": args.users,
+        "messages": len(latencies),
+        "seconds": round(wall, 3),
+        "messages_per_second": round(len(latencies) / wall, 2) if wall else None,
+        "latency_p50": round(percentile(latencies, 0.50), 4),
+        "latency_p95": round(percentile(latencies, 0.95), 4),
+        "latency_p99": round(percentile(latencies, 0.99), 4),
+        "failed_answers": sum(events.get(e, 0) for e in (
+            "answer_errors", "unexpected_errors", "runs_timed_out", "breaker_rejected")),
+        "retries": events.get("openai_retries", 0),
+        "cache_hits": events.get("answer_cache_hits", 0),
+        "shed": events.get("shed_full", 0) + events.get("shed_stale", 0),
+        "openai_calls": dict(api.calls),
+        "telegram_calls": dict(fake_bot.calls),
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+    }
+
+
+def compare(result, baseline, max_regression) -> list:
+    """Returns the measurements that got worse than ``baseline`` by more than
+    ``max_regression`` (a fraction)."""
+    problems = []
+    if result["messages_per_second"] < baseline["messages_per_second"] * (1 - max_regression):
+        problems.append(
+            f"throughput {result['messages_per_second']} msg/s "
+            f"< baseline {baseline['messages_per_second']} msg/s"
+        )
+    for key in ("latency_p50", "latency_p95", "latency_p99", "peak_rss_mb"):
+        if result.get(key) is None or baseline.get(key) is None:
+            continue
+        if result[key] > baseline[key] * (1 + max_regression):
+            problems.append(f"{key} {result[key]} > baseline {baseline[key]}")
+    return problems
+
+
+def format_result(result) -> str:
+    """Formats the measurements for the terminal."""
+    lines = [
+        f"Users: {result['users']}, messages: {result['messages']}, "
+        f"time: {result['seconds']:.2f}s",
+        f"Throughput: {result['messages_per_second']} messages/s",
+        f"Latency p50/p95/p99: {result['latency_p50'] * 1000:.0f}/"
+        f"{result['latency_p95'] * 1000:.0f}/{result['latency_p99'] * 1000:.0f} ms",
+        f"Failed answers: {result['failed_answers']}, cache hits: {result['cache_hits']}, "
+        f"shed: {result['shed']}, retries: {result.get('retries', 0)}",
+        "OpenAI calls: " + ", ".join(f"{k}={v}" for k, v in sorted(result["openai_calls"].items())),
+        "Telegram calls: " + ", ".join(
+            f"{k}={v}" for k, v in sorted(result["telegram_calls"].items())),
+    ]
+    if result["peak_rss_mb"] is not None:
+        lines.append(f"Peak RSS: {result['peak_rss_mb']} MiB")
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser."""
+    parser = argparse.ArgumentParser(prog="python -m src.bench",
+                                     description="Offline load test of the bot.")
+    load = parser.add_argument_group("load")
+    load.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    load.add_argument("--messages", type=int, default=10, help="messages per user")
+    load.add_argument("--repeat", type=float, default=0.0,
+                      help="probability that a message is one of the common questions")
+    load.add_argument("--common-pool", type=int, default=20,
+                      help="number of distinct common questions")
+    load.add_argument("--seed", type=int, default=1)
+
+    fakes = parser.add_argument_group("fake backends (seconds; sigma is the log-normal spread)")
+    fakes.add_argument("--api-latency", type=float, default=0.05,
+                       help="median latency of each OpenAI request")
+    fakes.add_argument("--api-sigma", type=float, default=0.3)
+    fakes.add_argument("--run-latency", type=float, default=1.0,
+                       help="median time for a run to complete")
+    fakes.add_argument("--run-sigma", type=float, default=0.5)
+    fakes.add_argument("--telegram-latency", type=float, default=0.03,
+                       help="median latency of each Telegram request")
+    fakes.add_argument("--telegram-sigma", type=float, default=0.3)
+    fakes.add_argument("--error-rate", type=float, default=0.0,
+                       help="probability that an OpenAI request fails with a connection error")
+    fakes.add_argument("--failure-rate", type=float, default=0.0,
+                       help="probability that a run ends as failed")
+    fakes.add_argument("--faults", metavar="LIST", default="",
+                       help="faults of the first OpenAI requests, in order, e.g. "
+                       "'500,429:2,conn,timeout,ok' (an HTTP status, with an optional "
+                       "Retry-After, a connection error, a timeout or a success)")
+
+    bot = parser.add_argument_group("bot")
+    bot.add_argument("--streaming", action="store_true", help="use the streaming mode")
+    bot.add_argument("--webhook", action="store_true",
+                     help="deliver updates through the webhook listener")
+    bot.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    bot.add_argument("--quota", action="store_true",
+                     help="keep the per-user quotas (disabled by default)")
+    bot.add_argument("--verbose", action="store_true", help="keep the bot's INFO logs")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--json", action="store_true", help="print the result as JSON")
+    output.add_argument("--save", metavar="FILE", help="write the result to FILE as JSON")
+    output.add_argument("--baseline", metavar="FILE",
+                        help="fail if the result is worse than this saved result")
+    output.add_argument("--max-regression", type=float, default=0.1,
+                        help="tolerated regression against the baseline, as a fraction")
+    return parser
+
+
+def main(argv=None) -> int:
+    """Runs the benchmark and reports the result."""
+    args = build_parser().parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    try:
+        prepare_environment(args, workdir)
+        result = asyncio.run(run_benchmark(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(result, indent=2) if args.json else format_result(result))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            problems = compare(result, json.load(file), args.max_regression)
+        for problem in problems:
+            print(f"Regression: {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
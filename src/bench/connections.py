@@ -0,0 +1,132 @@
+"""
+bench/connections.py
+Counts the connections the OpenAI and Telegram clients open under load.
+
+Usage::
+
+    python -m src.bench.connections [--concurrency 20] [--rounds 3] [--idle 6]
+
+A local HTTP server stands in for both APIs and counts new TCP connections.
+Each client sends ``--rounds`` bursts of ``--concurrency`` concurrent requests
+separated by ``--idle`` seconds, once with the libraries' default settings and
+once with the bot's tuned clients (pre-warmed beforehand, as on startup). A
+pool that keeps its connections alive across the idle gaps only opens
+connections in the first burst, or during pre-warming.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser."""
+    parser = argparse.ArgumentParser(prog="python -m src.bench.connections",
+                                     description="Count new connections per HTTP client.")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests per burst")
+    parser.add_argument("--rounds", type=int, default=3, help="number of bursts")
+    parser.add_argument("--idle", type=float, default=6.0,
+                        help="seconds between bursts (httpx closes idle connections after 5)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds the stand-in server takes per request")
+    return parser
+
+
+async def measure(args) -> list:
+    """Runs the scenarios and returns ``(name, connections at startup, connections
+    during the bursts, requests)`` rows."""
+    # pylint: disable=import-outside-toplevel
+    from openai import AsyncOpenAI
+    from telegram import Bot
+    from src.http_clients import create_openai_client, create_telegram_request, prewarm
+    from src.http_server import HTTPServer
+
+    class StandIn(HTTPServer):
+        """Answers getMe and assistant lookups, counting connections and requests."""
+
+        name = "Stand-in API"
+
+        def __init__(self):
+            super().__init__("127.0.0.1", 0)
+            self.connections = 0
+            self.requests = 0
+
+        async def _serve_connection(self, reader, writer):
+            self.connections += 1
+            await super()._serve_connection(reader, writer)
+
+        async def handle(self, method, path, headers, body):
+            self.requests += 1
+            await asyncio.sleep(args.latency)
+            if path.endswith("/getMe"):
+                payload = {"ok": True, "result": {
+                    "id": 1, "is_bot": True, "first_name": "Stand-in", "username": "standin_bot"}}
+            else:
+                payload = {"id": path.rsplit("/", 1)[-1], "object": "assistant", "created_at": 0,
+                           "name": "Stand-in", "model": "gpt-standin", "tools": [],
+                           "instructions": None, "description": None, "metadata": {}}
+            return 200, json.dumps(payload).encode(), "application/json"
+
+    server = StandIn()
+    await server.start()
+    base = f"http://127.0.0.1:{server.port}"
+
+    def telegram_bot(request):
+        return Bot("1:STANDIN", base_url=f"{base}/bot", request=request)
+
+    async def run(name, bot, client, warm):
+        server.connections = 0
+        await bot.initialize()
+        if warm:
+            await prewarm(bot, client, args.concurrency)
+        startup = server.connections
+        server.connections = server.requests = 0
+        try:
+            for round_number in range(args.rounds):
+                if round_number:
+                    await asyncio.sleep(args.idle)
+                await asyncio.gather(
+                    *(bot.get_me() for _ in range(args.concurrency)),
+                    *(client.beta.assistants.retrieve("asst_standin")
+                      for _ in range(args.concurrency)),
+                )
+        finally:
+            await bot.shutdown()
+            await client.close()
+        return name, startup, server.connections, server.requests
+
+    rows = []
+    try:
+        rows.append(await run(
+            "default clients",
+            telegram_bot(None),
+            AsyncOpenAI(api_key="sk-standin", base_url=f"{base}/v1"),
+            warm=False,
+        ))
+        rows.append(await run(
+            "tuned, pre-warmed clients",
+            telegram_bot(create_telegram_request(use_http2=False)),
+            create_openai_client(use_http2=False, base_url=f"{base}/v1"),
+            warm=True,
+        ))
+    finally:
+        await server.stop()
+    return rows
+
+
+def main(argv=None) -> int:
+    """Runs the measurement and prints a table."""
+    args = build_parser().parse_args(argv)
+    os.environ.setdefault("CLIENT_API_KEY", "sk-standin")
+    os.environ.setdefault("ASSISTANT_ID", "asst_standin")
+    rows = asyncio.run(measure(args))
+    print(f"{'clients':<28}{'startup conns':>14}{'burst conns':>13}{'requests':>10}")
+    for name, startup, connections, requests in rows:
+        print(f"{name:<28}{startup:>14}{connections:>13}{requests:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
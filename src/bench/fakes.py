@@ -0,0 +1,250 @@
+"""
+bench/fakes.py
+In-process stand-ins for the OpenAI Assistants API and the Telegram Bot API.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+import types
+from collections import Counter
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+from telegram.ext import ExtBot
+
+
+class Latency:
+    """Log-normal latency distribution given by its median and spread.
+
+    ``sigma`` 0 gives a constant ``median``; 0.5 gives a p99 about 3.2 times the
+    median, a typical long tail for remote APIs.
+    """
+
+    def __init__(self, median, sigma=0.0, rng=random):
+        self.median = median
+        self.sigma = sigma
+        self.rng = rng
+
+    def sample(self) -> float:
+        """Draws one latency, in seconds."""
+        if self.median <= 0:
+            return 0.0
+        if not self.sigma:
+            return self.median
+        return self.median * self.rng.lognormvariate(0, self.sigma)
+
+
+class FakeObject(types.SimpleNamespace):
+    """Response object with the ``dict()`` accessor of the OpenAI models."""
+
+    def dict(self):
+        return {key: value for key, value in vars(self).items()}
+
+
+def _run(run_id, status, model):
+    return FakeObject(
+        id=run_id, status=status, model=model, assistant_id="asst_bench", instructions="",
+        created_at=0, started_at=0, completed_at=None, failed_at=None, cancelled_at=None,
+        expires_at=None, temperature=1.0, top_p=1.0, response_format=FakeObject(type="text"),
+        truncation_strategy=FakeObject(type="auto"), parallel_tool_calls=True, tools=[],
+    )
+
+
+def make_fault(name):
+    """Returns the exception the OpenAI client raises for fault ``name``, or None
+    for "ok".
+
+    ``name`` is "ok", "conn" (connection error), "timeout" or an HTTP status
+    code, optionally with a ``Retry-After`` in seconds: "429:2".
+    """
+    if name == "ok":
+        return None
+    if name == "conn":
+        return APIConnectionError(request=None)
+    if name == "timeout":
+        return APITimeoutError(request=None)
+    status, _, wait = name.partition(":")
+    request = httpx.Request("POST", "https://api.openai.com/v1/threads")
+    headers = {"retry-after": wait} if wait else {}
+    response = httpx.Response(int(status), headers=headers, request=request)
+    return APIStatusError(f"Error code: {status}", response=response, body=None)
+
+
+class FakeAssistants:
+    """The part of ``client.beta.threads`` the handlers use, served from memory.
+
+    Every call sleeps for ``api_latency`` and fails with ``APIConnectionError``
+    with probability ``error_rate``. A run completes ``run_latency`` seconds after
+    it is created, or ends as ``failed`` with probability ``failure_rate``.
+    ``faults`` is a sequence of fault names (see ``make_fault``) applied in order
+    to the first calls of the message pipeline (not to the pre-warm requests,
+    ``assistants.retrieve`` and ``get``), to replay an outage. ``calls`` counts the requests per
+    endpoint.
+    """
+
+    def __init__(self, api_latency, run_latency, error_rate=0.0, failure_rate=0.0,
+                 answer="This is a benchmark answer.", model="gpt-bench", rng=random,
+                 faults=()):
+        self.api_latency = api_latency
+        self.run_latency = run_latency
+        self.error_rate = error_rate
+        self.failure_rate = failure_rate
+        self.answer = answer
+        self.model = model
+        self.rng = rng
+        self.faults = iter(faults)
+        self.calls = Counter()
+        self._ids = itertools.count()
+        self._runs = {}       # run_id -> (time it finishes, final status)
+
+    def _new_id(self, prefix) -> str:
+        return f"{prefix}_{next(self._ids)}"
+
+    async def _call(self, endpoint) -> None:
+        self.calls[endpoint] += 1
+        await asyncio.sleep(self.api_latency.sample())
+        # The pre-warm requests at startup bypass the retries and the breaker.
+        if endpoint in ("assistants.retrieve", "get"):
+            return
+        fault = make_fault(next(self.faults, "ok"))
+        if fault is not None:
+            self.calls["errors"] += 1
+            raise fault
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.calls["errors"] += 1
+            raise APIConnectionError(request=None)
+
+    # client.beta.assistants
+    async def get(self, path, **kwargs):
+        """``client.get``, as used to warm connections: an empty response."""
+        await self._call("get")
+        return httpx.Response(200)
+
+    async def retrieve_assistant(self, assistant_id, **kwargs):
+        await self._call("assistants.retrieve")
+        return FakeObject(id=assistant_id, name="Benchmark assistant", model=self.model)
+
+    # client.beta.threads
+    async def create(self, **kwargs):
+        await self._call("threads.create")
+        return FakeObject(id=self._new_id("thread"))
+
+    def _finish(self, run_id) -> None:
+        status = "failed" if self.rng.random() < self.failure_rate else "completed"
+        self._runs[run_id] = (time.monotonic() + self.run_latency.sample(), status)
+
+    async def create_message(self, thread_id, role, content, **kwargs):
+        await self._call("messages.create")
+        return FakeObject(id=self._new_id("msg"), thread_id=thread_id, role=role)
+
+    async def list_messages(self, thread_id, **kwargs):
+        await self._call("messages.list")
+        return FakeObject(data=[{
+            "id": self._new_id("msg"),
+            "role": "assistant",
+            "content": [{"type": "text", "text": {"value": self.answer, "annotations": []}}],
+        }])
+
+    async def create_run(self, thread_id, assistant_id, **kwargs):
+        await self._call("runs.create")
+        run_id = self._new_id("run")
+        self._finish(run_id)
+        return _run(run_id, "queued", self.model)
+
+    async def retrieve_run(self, thread_id, run_id, **kwargs):
+        await self._call("runs.retrieve")
+        finishes, status = self._runs[run_id]
+        if time.monotonic() < finishes:
+            return _run(run_id, "in_progress", self.model)
+        del self._runs[run_id]
+        return _run(run_id, status, self.model)
+
+    async def cancel_run(self, thread_id, run_id, **kwargs):
+        await self._call("runs.cancel")
+        self._runs.pop(run_id, None)
+        return _run(run_id, "cancelling", self.model)
+
+    def stream_run(self, thread_id, assistant_id, **kwargs):
+        return _FakeRunStream(self)
+
+
+class _FakeRunStream:
+    """Async context manager yielding the events of a streamed run."""
+
+    def __init__(self, api):
+        self.api = api
+
+    async def __aenter__(self):
+        await self.api._call("runs.stream")  # pylint: disable=protected-access
+        return self._events()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def _events(self):
+        api = self.api
+        total = api.run_latency.sample()
+        run = _run(api._new_id("run"), "queued", api.model)  # pylint: disable=protected-access
+        yield FakeObject(event="thread.run.created", data=run)
+        if api.rng.random() < api.failure_rate:
+            await asyncio.sleep(total)
+            yield FakeObject(event="thread.run.failed", data=None)
+            return
+        words = api.answer.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(total / len(words))
+            text = word if i == 0 else " " + word
+            yield FakeObject(event="thread.message.delta", data=FakeObject(delta=FakeObject(
+                content=[FakeObject(type="text", text=FakeObject(value=text))]
+            )))
+        yield FakeObject(event="thread.run.completed", data=None)
+
+
+class FakeOpenAI:
+    """Drop-in replacement for ``AsyncOpenAI`` covering the Assistants calls."""
+
+    def __init__(self, api):
+        self.api = api
+        self.get = api.get
+        self.beta = FakeObject(
+            assistants=FakeObject(retrieve=api.retrieve_assistant),
+            threads=FakeObject(
+                create=api.create,
+                messages=FakeObject(create=api.create_message, list=api.list_messages),
+                runs=FakeObject(create=api.create_run, retrieve=api.retrieve_run,
+                                cancel=api.cancel_run, stream=api.stream_run),
+            ),
+        )
+
+
+class FakeBot(ExtBot):
+    """Telegram bot whose API requests are answered locally.
+
+    Requests never leave the process: ``getMe`` returns a fixed bot user and
+    every send or edit returns a message built from the request, after
+    ``latency``. ``calls`` counts the requests per endpoint.
+    """
+
+    def __init__(self, latency, token="123456:BENCH"):
+        super().__init__(token)
+        with self._unfrozen():
+            self.latency = latency
+            self.calls = Counter()
+            self._message_ids = itertools.count(1)
+
+    async def _do_post(self, endpoint, data, **kwargs):  # pylint: disable=arguments-differ
+        self.calls[endpoint] += 1
+        await asyncio.sleep(self.latency.sample())
+        if endpoint == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if endpoint in ("sendMessage", "editMessageText"):
+            chat_id = int(data["chat_id"])
+            return {
+                "message_id": int(data.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return True
@@ -0,0 +1,117 @@
+"""
+bench/importtime.py
+Import-time budget check for the bot's entry modules.
+
+Usage::
+
+    python -m src.bench.importtime [--runs 3] [--budget src.bot=100 ...]
+
+Each module is imported in a fresh interpreter with ``python -X importtime``,
+from an empty working directory, and its cumulative import time (the best of
+``--runs``) is compared with its budget in milliseconds. The check also fails
+when an import writes a file or loads an SDK the module must not need: the
+entry point, the configuration and the offline tools start without Telegram
+or OpenAI, which only the bot itself imports. Exits with 1 on any failure.
+``tests/test_importtime.py`` runs the same check under pytest.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# module -> (budget in ms, SDKs it must not import)
+BUDGETS = {
+    "src.bot": (100, ("telegram", "openai", "httpx")),
+    "src.config": (50, ("telegram", "openai", "httpx")),
+    "src.cli": (150, ("telegram", "openai", "httpx")),
+    "src.app": (2000, ()),
+}
+
+PROBE = "import sys, {module}; print(','.join(m for m in {sdks!r} if m in sys.modules))"
+
+
+def parse_importtime(stderr, module):
+    """Returns the cumulative import time of ``module`` in ms from the output
+    of ``-X importtime``, or None if it was not imported."""
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == module and not name[1:].startswith(" "):
+            return int(cumulative) / 1000
+    return None
+
+
+def measure(module, sdks):
+    """Imports ``module`` in a fresh interpreter.
+
+    :return: ``(milliseconds, SDKs loaded, files written)``.
+    """
+    with tempfile.TemporaryDirectory(prefix="importtime-") as workdir:
+        env = dict(os.environ, PYTHONPATH=str(ROOT), PYTHONDONTWRITEBYTECODE="1")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, sdks=sdks)],
+            cwd=workdir, env=env, capture_output=True, text=True, check=False,
+        )
+        written = sorted(os.listdir(workdir))
+    if result.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return parse_importtime(result.stderr, module), loaded, written
+
+
+def check(module, budget, sdks, runs=3):
+    """Measures ``module`` ``runs`` times against its budget and SDK list.
+
+    :return: ``(fastest time in ms, failure messages)``.
+    """
+    results = [measure(module, sdks) for _ in range(max(1, runs))]
+    elapsed = min(result[0] for result in results)
+    _, loaded, written = results[0]
+    failures = []
+    if elapsed > budget:
+        failures.append(f"{module} took {elapsed:.1f} ms, budget {budget:.0f} ms")
+    if loaded:
+        failures.append(f"{module} imports {', '.join(loaded)}")
+    if written:
+        failures.append(f"{module} writes {', '.join(written)} on import")
+    return elapsed, failures
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser."""
+    parser = argparse.ArgumentParser(prog="python -m src.bench.importtime",
+                                     description="Check the import time of the entry modules.")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="imports per module; the fastest one counts")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="override or add a budget, e.g. src.bot=80")
+    return parser
+
+
+def main(argv=None) -> int:
+    """Measures every module and reports the ones over budget."""
+    args = build_parser().parse_args(argv)
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        module, _, budget = item.partition("=")
+        budgets[module] = (float(budget), budgets.get(module, (0, ()))[1])
+
+    failures = []
+    print(f"{'module':<14}{'ms':>8}{'budget':>8}")
+    for module, (budget, sdks) in budgets.items():
+        elapsed, module_failures = check(module, budget, sdks, args.runs)
+        print(f"{module:<14}{elapsed:>8.1f}{budget:>8.0f}")
+        failures.extend(module_failures)
+    for failure in failures:
+        print(f"Failed: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+bench/sharding.py
+Throughput of the multi-process mode for an increasing number of workers.
+
+Usage::
+
+    python -m src.bench.sharding [--workers 1,2,4] [--users 400] [--messages 5]
+
+For each worker count a real ``Supervisor`` starts the worker processes, each
+running the bot's application and handlers against the in-process fakes of
+``src.bench.fakes``. Simulated users send their messages one after the other
+and updates are routed to the workers by chat, as the supervisor's application
+does. With short fake latencies the workers are CPU-bound, so on a machine
+with enough cores the throughput should grow almost linearly with the workers.
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from .__main__ import make_update, percentile, prepare_environment
+
+
+def bench_worker(index, updates, shared, results=None, args=None) -> None:
+    """Worker process target: the bot's application with fake backends. It
+    reports every answered update id on ``results``, and ``-1`` once started."""
+    # pylint: disable=import-outside-toplevel
+    from telegram.ext import Application, MessageHandler, filters
+    from src import app as app_module, handlers
+    from src.bot import bootstrap
+    from src.supervisor import prepare_worker, serve_worker
+    from .fakes import FakeAssistants, FakeBot, FakeOpenAI, Latency
+
+    bootstrap()
+    for name in ("src", "telegram", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    prepare_worker(index, shared)
+    rng = random.Random(args.seed + index)
+    handlers.client = FakeOpenAI(FakeAssistants(
+        api_latency=Latency(args.api_latency, 0.3, rng),
+        run_latency=Latency(args.run_latency, 0.5, rng),
+        rng=rng,
+    ))
+
+    async def on_startup(app):
+        await app_module.on_startup(app)
+        results.put(-1)
+
+    async def done(update, context):  # pylint: disable=unused-argument
+        results.put(update.update_id)
+
+    app = (
+        Application.builder()
+        .bot(FakeBot(Latency(args.telegram_latency, 0.3, rng)))
+        .concurrent_updates(app_module.create_update_processor())
+        .post_init(on_startup)
+        .post_shutdown(app_module.on_shutdown)
+        .build()
+    )
+    app_module.setup_handlers(app)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, done), group=1)
+    asyncio.run(serve_worker(app, updates))
+
+
+async def measure(args, workers) -> dict:
+    """Runs the load with ``workers`` worker processes and returns the measurements."""
+    # pylint: disable=import-outside-toplevel
+    from telegram import Update
+    from src.supervisor import Supervisor
+
+    loop = asyncio.get_running_loop()
+    results = multiprocessing.get_context("spawn").Queue()
+    supervisor = Supervisor(
+        workers, target=functools.partial(bench_worker, results=results, args=args)
+    )
+    pending = {}
+    ready = asyncio.Event()
+    started_workers = 0
+
+    async def collect():
+        nonlocal started_workers
+        while True:
+            update_id = await asyncio.to_thread(results.get)
+            if update_id is None:
+                return
+            if update_id == -1:
+                started_workers += 1
+                if started_workers == workers:
+                    ready.set()
+                continue
+            future = pending.pop(update_id, None)
+            if future is not None:
+                future.set_result(loop.time())
+
+    update_ids = iter(range(1, 10 ** 9))
+    latencies = []
+
+    async def user(user_id):
+        for i in range(args.messages):
+            update_id = next(update_ids)
+            future = pending[update_id] = loop.create_future()
+            sent = loop.time()
+            data = make_update(update_id, user_id, f"Question {i} from user {user_id}?")
+            supervisor.dispatch(Update.de_json(data, None))
+            latencies.append(await future - sent)
+
+    collector = asyncio.create_task(collect())
+    await supervisor.start()
+    try:
+        await asyncio.wait_for(ready.wait(), 60)
+        started = loop.time()
+        await asyncio.gather(*(user(1000 + u) for u in range(args.users)))
+        wall = loop.time() - started
+    finally:
+        await supervisor.stop()
+        results.put(None)
+        await collector
+    latencies.sort()
+    return {
+        "workers": workers,
+        "messages": len(latencies),
+        "seconds": round(wall, 3),
+        "messages_per_second": round(len(latencies) / wall, 2),
+        "latency_p50": round(percentile(latencies, 0.50), 4),
+        "latency_p99": round(percentile(latencies, 0.99), 4),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser."""
+    parser = argparse.ArgumentParser(prog="python -m src.bench.sharding",
+                                     description="Throughput per number of worker processes.")
+    parser.add_argument("--workers", default="1,2,4",
+                        help="comma-separated worker counts to measure")
+    parser.add_argument("--users", type=int, default=400, help="concurrent simulated users")
+    parser.add_argument("--messages", type=int, default=5, help="messages per user")
+    parser.add_argument("--api-latency", type=float, default=0.005)
+    parser.add_argument("--run-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser
+
+
+def main(argv=None) -> int:
+    """Runs the measurements and prints a table."""
+    args = build_parser().parse_args(argv)
+    # prepare_environment also reads the options of the main benchmark.
+    args.storage, args.streaming, args.quota = "json", False, False
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    rows = []
+    try:
+        prepare_environment(args, workdir)
+        # Measure the workers' capacity, not the admission control.
+        os.environ["MAX_CONCURRENT_UPDATES"] = str(args.users)
+        os.environ["WORK_QUEUE_MAX_DEPTH"] = str(args.users)
+        for workers in (int(w) for w in args.workers.split(",")):
+            rows.append(asyncio.run(measure(args, workers)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'workers':>8}{'msg/s':>10}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for row in rows:
+        speedup = row["messages_per_second"] / rows[0]["messages_per_second"]
+        print(f"{row['workers']:>8}{row['messages_per_second']:>10}{speedup:>8.2f}x"
+              f"{row['latency_p50'] * 1000:>9.0f}{row['latency_p99'] * 1000:>9.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
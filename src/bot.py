@@ -1,30 +1,57 @@
 """
 bot.py
 Entry point for the bot.
+
+Importing this module only reads the configuration: it writes no files and
+loads neither the Telegram nor the OpenAI SDK. ``main`` bootstraps the process
+and imports what the configured mode needs.
 """
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from .config import telegram_token
-from .handlers import start, help_command, process_message
-from .logs.config_logger import LoggerConfigurator
+import logging
+
+from .config import (
+    serving_mode, worker_processes, log_max_bytes, log_max_age, log_backup_count,
+    log_retention_bytes,
+)
+from .logs.config_logger import LoggerConfigurator, RotatingConfigStrategy
+
+logger = logging.getLogger(__name__)
 
-# Configuración del logger al inicio del script
-logger = LoggerConfigurator().configure()
-logger.debug("Logger configurado correctamente al inicio del servidor.")
 
-application = Application.builder().token(telegram_token).build()
+def bootstrap() -> None:
+    """Prepares the process to run the bot: configures logging, with the log
+    files rotating when a rotation limit is set.
+
+    Idempotent; the entry points of the bot and of its worker processes call it
+    before anything logs.
+    """
+    strategy = None
+    if log_max_bytes or log_max_age:
+        strategy = RotatingConfigStrategy(
+            max_bytes=log_max_bytes, max_age=log_max_age,
+            retention_bytes=log_retention_bytes, backup_count=log_backup_count,
+        )
+    LoggerConfigurator(strategy).configure()
 
-def setup_handlers(app):
-    """Sets up the command and message handlers for the bot."""
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
 
 def main():
     """Main function to run the bot."""
+    # pylint: disable=import-outside-toplevel
+    bootstrap()
     logger.info("Starting the bot...")
-    setup_handlers(application)
-    logger.info("Polling for messages...")
-    application.run_polling()
+    if worker_processes > 1:
+        from .supervisor import run_supervisor
+        run_supervisor(worker_processes)
+        return
+    from .app import build_application
+    from .webhook import run_webhook
+    application = build_application()
+    if serving_mode == "webhook":
+        logger.info("Serving updates through the webhook...")
+        run_webhook(application)
+    else:
+        logger.info("Polling for messages...")
+        application.run_polling()
+
 
 if __name__ == "__main__":
     main()
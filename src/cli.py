@@ -0,0 +1,180 @@
+"""
+cli.py
+Offline maintenance commands for the bot's data files.
+
+Usage::
+
+    python -m src.cli migrate [--source questions_answers.json] [--dest questions_answers.jsonl]
+    python -m src.cli compact [--path questions_answers.jsonl]
+    python -m src.cli rotate [--path questions_answers.jsonl] [--max-bytes N] [--gzip]
+    python -m src.cli stats [--path FILE ...] [--since DATE] [--until DATE] [--top 20] [--output FILE]
+    python -m src.cli export --output FILE [--path FILE ...] [--user ID] [--chunk-size N]
+
+``stats`` and ``export`` stream the history and can run while the bot is
+writing it; the other commands need the bot stopped.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from . import analytics, storage
+from .config import qa_log_file
+
+
+def cmd_migrate(args) -> int:
+    """Converts the legacy JSON array history into the JSON-lines log."""
+    count = storage.migrate_json_array(args.source, args.dest)
+    print(f"Migrated {count} records from {args.source} to {args.dest}.")
+    return 0
+
+
+def cmd_compact(args) -> int:
+    """Drops corrupted lines from the JSON-lines log."""
+    kept, dropped = storage.compact(args.path)
+    print(f"Compacted {args.path}: kept {kept} records, dropped {dropped} lines.")
+    return 0
+
+
+def cmd_rotate(args) -> int:
+    """Moves the JSON-lines log aside so a new one is started."""
+    rotated = storage.rotate(args.path, args.max_bytes, args.gzip)
+    if rotated is None:
+        print(f"{args.path} was not rotated.")
+    else:
+        print(f"Rotated {args.path} to {rotated}.")
+    return 0
+
+
+def _lower_priority(niceness) -> None:
+    """Lowers the CPU priority of a long scan so the live bot keeps its share."""
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def cmd_stats(args) -> int:
+    """Prints per-user, question, answer length and daily statistics of the history."""
+    _lower_priority(args.nice)
+    stats = analytics.HistoryStats(args.user_capacity, args.question_capacity)
+    for record in analytics.select(analytics.iter_history(args.path), args.since, args.until):
+        stats.add(record)
+    summary = stats.summary()
+
+    if args.output:
+        with analytics.ChunkedWriter(args.output, analytics.ROW_FIELDS, args.format,
+                                     args.chunk_size) as writer:
+            for row in stats.rows(args.top or None):
+                writer.write(row)
+        print(f"Wrote {writer.rows} rows to {', '.join(map(str, writer.files))}.")
+        return 0
+    if args.format == "jsonl":
+        print(json.dumps({"summary": summary, "rows": list(stats.rows(args.top or None))},
+                         ensure_ascii=False))
+        return 0
+    if args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, analytics.ROW_FIELDS)
+        writer.writeheader()
+        writer.writerows(stats.rows(args.top or None))
+        return 0
+
+    print(f"{summary['records']} records from {summary['first']} to {summary['last']}, "
+          f"{summary['days']} days.")
+    print(f"Answer length: mean {summary['answer_length_mean']}, "
+          f"p50 <= {summary['answer_length_p50']}, p95 <= {summary['answer_length_p95']}, "
+          f"max {summary['answer_length_max']} characters.")
+    titles = {
+        "users": "Top users" + ("" if summary["users_exact"] else " (approximate)"),
+        "questions": "Top questions" + ("" if summary["questions_exact"] else " (approximate)"),
+        "answer_length": "Answer length (characters)",
+        "daily": "Daily volume",
+    }
+    section = None
+    for row in stats.rows(args.top or None):
+        if row["section"] != section:
+            section = row["section"]
+            print(f"\n{titles[section]}:")
+        label = f" ({row['label']})" if row["label"] else ""
+        error = f" ±{row['error']}" if row["error"] else ""
+        print(f"  {row['count']:>8}{error}  {row['key']}{label}")
+    return 0
+
+
+def cmd_export(args) -> int:
+    """Writes the records of the history to CSV or JSON-lines files."""
+    _lower_priority(args.nice)
+    records = analytics.select(analytics.iter_history(args.path), args.since, args.until,
+                               args.user)
+    with analytics.ChunkedWriter(args.output, analytics.RECORD_FIELDS, args.format,
+                                 args.chunk_size) as writer:
+        for record in records:
+            writer.write(record)
+    print(f"Exported {writer.rows} records to {', '.join(map(str, writer.files))}.")
+    return 0
+
+
+def _add_scan_arguments(parser) -> None:
+    """Options shared by the commands that stream the history."""
+    parser.add_argument("--path", action="append",
+                        help="history file to read, JSON lines, .gz or legacy array; repeat "
+                             "for rotated logs (default: the configured storage backend)")
+    parser.add_argument("--since", help="first date to include, YYYY-MM-DD")
+    parser.add_argument("--until", help="last date to include, YYYY-MM-DD")
+    parser.add_argument("--format", choices=("csv", "jsonl"),
+                        help="output format (default: from the output file's extension)")
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="rows per output file; 0 writes a single file")
+    parser.add_argument("--nice", type=int, default=10,
+                        help="lower the CPU priority by this much while scanning")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser with one subcommand per maintenance task."""
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description=__doc__.split("\n")[2])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="convert questions_answers.json to JSON lines")
+    migrate.add_argument("--source", default="questions_answers.json")
+    migrate.add_argument("--dest", default=qa_log_file)
+    migrate.set_defaults(func=cmd_migrate)
+
+    compact = subparsers.add_parser("compact", help="remove corrupted lines from the Q&A log")
+    compact.add_argument("--path", default=qa_log_file)
+    compact.set_defaults(func=cmd_compact)
+
+    rotate = subparsers.add_parser("rotate", help="start a new Q&A log, keeping the old one")
+    rotate.add_argument("--path", default=qa_log_file)
+    rotate.add_argument("--max-bytes", type=int, default=0,
+                        help="only rotate logs at least this large")
+    rotate.add_argument("--gzip", action="store_true", help="compress the rotated log")
+    rotate.set_defaults(func=cmd_rotate)
+
+    stats = subparsers.add_parser("stats", help="statistics of the Q&A history")
+    _add_scan_arguments(stats)
+    stats.add_argument("--top", type=int, default=20,
+                       help="users and questions to report; 0 reports every tracked one")
+    stats.add_argument("--output", help="write the results to this CSV or JSON-lines file")
+    stats.add_argument("--user-capacity", type=int, default=100000,
+                       help="users counted exactly before counts become approximate")
+    stats.add_argument("--question-capacity", type=int, default=1000,
+                       help="distinct questions tracked by the heavy-hitter sketch")
+    stats.set_defaults(func=cmd_stats)
+
+    export = subparsers.add_parser("export", help="export the Q&A history to CSV or JSON lines")
+    _add_scan_arguments(export)
+    export.add_argument("--output", required=True, help="CSV or JSON-lines file to write")
+    export.add_argument("--user", type=int, help="only export this Telegram user id")
+    export.set_defaults(func=cmd_export)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    """Parses the command line and runs the selected subcommand."""
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,3 +12,173 @@ load_dotenv()
 assistant_id = os.getenv("ASSISTANT_ID")
 client_api_key = os.getenv("CLIENT_API_KEY")
 telegram_token = os.getenv("TELEGRAM_TOKEN")
+
+# Maximum number of updates handled at the same time. Updates from different
+# chats run in parallel up to this limit; updates from the same chat are always
+# processed one after another, in arrival order. Use 1 to process sequentially.
+max_concurrent_updates = int(os.getenv("MAX_CONCURRENT_UPDATES", "16"))
+
+# Question/answer history, stored as JSON lines (one record per line).
+qa_log_file = os.getenv("QA_LOG_FILE", "questions_answers.jsonl")
+# Optional fsync batching for the history: fsync after this many records and/or
+# every this many seconds, from a background thread. Both default to 0, which
+# leaves flushing to the OS.
+qa_fsync_every = int(os.getenv("QA_FSYNC_EVERY", "0"))
+qa_fsync_interval = float(os.getenv("QA_FSYNC_INTERVAL", "0"))
+
+# Daily message counter file, used by the JSON storage backend.
+message_count_file = os.getenv("MESSAGE_COUNT_FILE", "message_count.json")
+
+# Storage backend for the Q&A history and counters: "json" (JSON-lines log plus
+# message_count.json) or "sqlite".
+storage_backend = os.getenv("STORAGE_BACKEND", "json")
+# SQLite database path and write batching: the background writer commits after
+# SQLITE_BATCH_SIZE records or SQLITE_BATCH_INTERVAL_MS milliseconds.
+sqlite_path = os.getenv("SQLITE_PATH", "conversations.db")
+sqlite_batch_size = int(os.getenv("SQLITE_BATCH_SIZE", "100"))
+sqlite_batch_interval_ms = int(os.getenv("SQLITE_BATCH_INTERVAL_MS", "200"))
+
+# Global daily limit of answered messages, and how often (in seconds) the
+# in-memory message counter is written to storage.
+daily_message_limit = int(os.getenv("DAILY_MESSAGE_LIMIT", "100"))
+counter_flush_interval = float(os.getenv("COUNTER_FLUSH_INTERVAL", "30"))
+
+# Per-user quota: each user may send USER_QUOTA_BURST messages at once and then
+# USER_QUOTA_PER_MINUTE messages per minute. DAILY_MESSAGE_LIMIT stays the
+# global ceiling. Quota state is saved every QUOTA_FLUSH_INTERVAL seconds.
+user_quota_per_minute = float(os.getenv("USER_QUOTA_PER_MINUTE", "5"))
+user_quota_burst = float(os.getenv("USER_QUOTA_BURST", "10"))
+quota_state_file = os.getenv("QUOTA_STATE_FILE", "quota_state.json")
+quota_flush_interval = float(os.getenv("QUOTA_FLUSH_INTERVAL", "60"))
+
+# Answer cache: up to ANSWER_CACHE_SIZE normalized questions (0 disables it),
+# each kept for ANSWER_CACHE_TTL seconds. ANSWER_CACHE_WARM_FILE optionally
+# preloads it at startup from a Q&A history file (JSON array or JSON lines).
+answer_cache_size = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+answer_cache_ttl = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+answer_cache_warm_file = os.getenv("ANSWER_CACHE_WARM_FILE", "")
+
+# Near-duplicate matching: when enabled, a question whose character-trigram
+# similarity to an earlier one is at least SIMILARITY_THRESHOLD (0-1) is answered
+# from the stored history instead of the Assistants API.
+similarity_matching = os.getenv("SIMILARITY_MATCHING", "false").lower() in ("1", "true", "yes")
+similarity_threshold = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+
+# Each user keeps one OpenAI thread, so follow-up messages have the conversation
+# context. The telegram_id -> thread_id map is saved to THREAD_STORE_FILE every
+# THREAD_FLUSH_INTERVAL seconds; users idle for THREAD_IDLE_TTL seconds start over.
+thread_store_file = os.getenv("THREAD_STORE_FILE", "threads.json")
+thread_idle_ttl = float(os.getenv("THREAD_IDLE_TTL", str(24 * 60 * 60)))
+thread_flush_interval = float(os.getenv("THREAD_FLUSH_INTERVAL", "60"))
+
+# Adaptive run polling. Polls start POLL_MIN_INTERVAL seconds apart and back off
+# by POLL_BACKOFF up to POLL_MAX_INTERVAL, with +/- POLL_JITTER randomization.
+# The first poll and the deadline follow the last POLL_WINDOW run durations;
+# the deadline stays within [POLL_MIN_DEADLINE, POLL_MAX_DEADLINE] seconds and is
+# POLL_DEADLINE until there is data.
+poll_min_interval = float(os.getenv("POLL_MIN_INTERVAL", "0.25"))
+poll_max_interval = float(os.getenv("POLL_MAX_INTERVAL", "2"))
+poll_backoff = float(os.getenv("POLL_BACKOFF", "1.5"))
+poll_jitter = float(os.getenv("POLL_JITTER", "0.2"))
+poll_deadline = float(os.getenv("POLL_DEADLINE", "30"))
+poll_min_deadline = float(os.getenv("POLL_MIN_DEADLINE", "10"))
+poll_max_deadline = float(os.getenv("POLL_MAX_DEADLINE", "120"))
+poll_window = int(os.getenv("POLL_WINDOW", "200"))
+
+# Streaming mode: answers are shown while they are generated, by editing a
+# placeholder message at most once every STREAM_EDIT_INTERVAL seconds.
+streaming_enabled = os.getenv("STREAMING_ENABLED", "false").lower() in ("1", "true", "yes")
+stream_edit_interval = float(os.getenv("STREAM_EDIT_INTERVAL", "1"))
+
+# Logging of conversation content, off by default: with LOG_PAYLOADS the text
+# of questions and answers is logged at DEBUG level, and RUN_LOG_SAMPLE_RATE of
+# the run polls with the full run details (instructions included).
+log_payloads = os.getenv("LOG_PAYLOADS", "false").lower() in ("1", "true", "yes")
+run_log_sample_rate = float(os.getenv("RUN_LOG_SAMPLE_RATE", "0.05"))
+
+# Telegram user ids allowed to use /stats, comma separated.
+admin_ids = frozenset(int(i) for i in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if i)
+
+# Prometheus text endpoint (GET /metrics) on METRICS_HOST:METRICS_PORT; 0 disables it.
+metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+metrics_port = int(os.getenv("METRICS_PORT", "0"))
+
+# How updates arrive: "polling" (getUpdates long polling) or "webhook" (Telegram
+# POSTs them to WEBHOOK_LISTEN:WEBHOOK_PORT at WEBHOOK_PATH). With WEBHOOK_URL,
+# the public base URL, the webhook is registered on startup. Requests must carry
+# WEBHOOK_SECRET_TOKEN, required unless WEBHOOK_URL is set (then a random one is
+# used). The last WEBHOOK_DEDUP_SIZE update ids are kept to drop redeliveries.
+serving_mode = os.getenv("SERVING_MODE", "polling").lower()
+webhook_listen = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+webhook_port = int(os.getenv("WEBHOOK_PORT", "8443"))
+webhook_path = os.getenv("WEBHOOK_PATH", "/telegram")
+webhook_url = os.getenv("WEBHOOK_URL", "")
+webhook_secret_token = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+webhook_max_connections = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+webhook_dedup_size = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+
+# HTTP clients. At most OPENAI_MAX_CONNECTIONS / TELEGRAM_MAX_CONNECTIONS
+# concurrent requests per API, all kept alive for HTTP_KEEPALIVE_EXPIRY seconds
+# once idle. HTTP2 is "auto" (used when the h2 package is installed), "true" or
+# "false". Timeouts are in seconds. PREWARM_CONNECTIONS connections to each API
+# are opened on startup.
+openai_max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+openai_timeout = float(os.getenv("OPENAI_TIMEOUT", "60"))
+openai_connect_timeout = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+telegram_max_connections = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "64"))
+telegram_read_timeout = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+telegram_write_timeout = float(os.getenv("TELEGRAM_WRITE_TIMEOUT", "10"))
+telegram_connect_timeout = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+telegram_pool_timeout = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))
+http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+http2 = os.getenv("HTTP2", "auto").lower()
+prewarm_connections = int(os.getenv("PREWARM_CONNECTIONS", "4"))
+
+# Admission control. Beyond the MAX_CONCURRENT_UPDATES messages being answered,
+# at most WORK_QUEUE_MAX_DEPTH wait for their turn; further messages get a "busy"
+# reply right away. Messages still waiting WORK_QUEUE_DEADLINE seconds after
+# they entered the queue are dropped with the same reply.
+work_queue_max_depth = int(os.getenv("WORK_QUEUE_MAX_DEPTH", "64"))
+work_queue_deadline = float(os.getenv("WORK_QUEUE_DEADLINE", "30"))
+
+# Resilience of the OpenAI calls. Idempotent calls are attempted up to
+# OPENAI_MAX_ATTEMPTS times, waiting a random delay up to RETRY_BASE_DELAY * 2^n
+# (capped at RETRY_MAX_DELAY) or the Retry-After the API asks for (capped at
+# RETRY_AFTER_MAX) between attempts. BREAKER_FAILURE_THRESHOLD consecutive
+# failures open the circuit breaker for BREAKER_RESET_TIMEOUT seconds.
+openai_max_attempts = int(os.getenv("OPENAI_MAX_ATTEMPTS", "3"))
+retry_base_delay = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+retry_max_delay = float(os.getenv("RETRY_MAX_DELAY", "8"))
+retry_after_max = float(os.getenv("RETRY_AFTER_MAX", "30"))
+breaker_failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+breaker_reset_timeout = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Debouncing. With DEBOUNCE_WINDOW > 0, text messages a chat sends less than
+# DEBOUNCE_WINDOW seconds apart are answered together as one question, once the
+# chat has been quiet for that long or at most DEBOUNCE_MAX_WAIT seconds after
+# the first of them.
+debounce_window = float(os.getenv("DEBOUNCE_WINDOW", "0"))
+debounce_max_wait = float(os.getenv("DEBOUNCE_MAX_WAIT", "3"))
+
+# Multi-process mode. With WORKER_PROCESSES > 1 a supervisor fetches the
+# updates (polling or webhook, per SERVING_MODE) and hands each one to one of
+# that many worker processes, chosen by chat id. Crashed workers are restarted
+# after WORKER_RESTART_DELAY seconds; on shutdown, workers get
+# WORKER_DRAIN_TIMEOUT seconds to finish the messages they have. Quotas and
+# conversation threads are shared by the workers in tables of
+# WORKER_SHARED_SLOTS users each; beyond that many active users, the least
+# recently seen ones are forgotten.
+worker_processes = int(os.getenv("WORKER_PROCESSES", "1"))
+worker_restart_delay = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+worker_drain_timeout = float(os.getenv("WORKER_DRAIN_TIMEOUT", "60"))
+worker_shared_slots = int(os.getenv("WORKER_SHARED_SLOTS", "65536"))
+
+# Rotation of the log files (src/logs/sistema.log). A file is rotated before it
+# grows past LOG_MAX_BYTES or once it is LOG_MAX_AGE seconds old; rotated files
+# are gzipped in the background, and the oldest are deleted beyond
+# LOG_BACKUP_COUNT files or LOG_RETENTION_BYTES bytes in total. 0 disables a
+# limit; with LOG_MAX_BYTES and LOG_MAX_AGE at 0 the files are not rotated.
+log_max_bytes = int(os.getenv("LOG_MAX_BYTES", "0"))
+log_max_age = float(os.getenv("LOG_MAX_AGE", "0"))
+log_backup_count = int(os.getenv("LOG_BACKUP_COUNT", "0"))
+log_retention_bytes = int(os.getenv("LOG_RETENTION_BYTES", "0"))
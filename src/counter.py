@@ -0,0 +1,104 @@
+"""
+counter.py
+In-memory daily message counter with periodic persistence.
+"""
+
+import contextlib
+import datetime
+import time
+
+from .config import daily_message_limit, counter_flush_interval
+from .persistence import PeriodicFlush
+from .utils import get_message_count, update_message_count
+
+
+def _next_midnight() -> float:
+    """Returns the epoch time of the next local midnight."""
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time()).timestamp()
+
+
+class DailyMessageCounter(PeriodicFlush):
+    """Counts today's answered messages in memory.
+
+    ``try_increment`` never awaits, so on the event loop the check and the
+    increment happen atomically. The value is written through the storage
+    backend every ``flush_interval`` seconds and on shutdown, and reloaded at
+    startup; a saved count from a previous day starts today at zero.
+
+    Worker processes started by the supervisor ``share`` one count, so the
+    daily limit holds across all of them. Its lock is not released if a worker
+    is killed while holding it, so it is never held across I/O.
+    """
+
+    def __init__(self, limit=daily_message_limit, flush_interval=counter_flush_interval):
+        self.limit = limit
+        self.flush_interval = flush_interval
+        # [day as a date ordinal, count]
+        self._state = [datetime.date.today().toordinal(), 0]
+        self._lock = contextlib.nullcontext()
+        self._rollover_at = _next_midnight()
+        self._dirty = False
+
+    def share(self, state) -> None:
+        """Keeps the count in ``state``, a ``multiprocessing.Array("q", 2)``
+        shared with the other worker processes."""
+        self._state = state
+        self._lock = state.get_lock()
+
+    @property
+    def date(self) -> str:
+        """The day being counted, as an ISO date."""
+        return str(datetime.date.fromordinal(self._state[0]))
+
+    @property
+    def count(self) -> int:
+        """Messages counted so far today."""
+        return self._state[1]
+
+    def load(self) -> None:
+        """Loads the persisted count, discarding it if it belongs to another day."""
+        data = get_message_count()
+        today = datetime.date.today()
+        self._rollover_at = _next_midnight()
+        with self._lock:
+            if self._state[0] != today.toordinal():
+                self._state[0], self._state[1] = today.toordinal(), 0
+            if data.get("date") == str(today):
+                # Other workers may have counted more since it was saved.
+                self._state[1] = max(self._state[1], data["count"])
+        self._dirty = False
+
+    def _roll_over(self) -> None:
+        # Called with the lock held; another worker may have rolled over already.
+        today = datetime.date.today().toordinal()
+        if self._state[0] != today:
+            self._state[0], self._state[1] = today, 0
+        self._rollover_at = _next_midnight()
+        self._dirty = True
+
+    def try_increment(self) -> bool:
+        """Counts one message if today's limit allows it.
+
+        :return: True if the message was counted, False if the limit is reached.
+        """
+        with self._lock:
+            if time.time() >= self._rollover_at:
+                self._roll_over()
+            if self._state[1] >= self.limit:
+                return False
+            self._state[1] += 1
+        self._dirty = True
+        return True
+
+    def flush(self) -> None:
+        """Persists the count if it changed since the last flush."""
+        if self._dirty:
+            self._dirty = False
+            with self._lock:
+                date, count = self.date, self.count
+            # The count may still be yesterday's if no message arrived since midnight.
+            update_message_count(count, date)
+
+
+message_counter = DailyMessageCounter()
@@ -0,0 +1,122 @@
+"""
+debounce.py
+Merging of quick consecutive messages from the same chat into one question.
+"""
+
+import asyncio
+
+from .config import debounce_window, debounce_max_wait
+from .metrics import metrics
+
+
+class _Batch:
+    """Text messages of one chat waiting to be answered together."""
+
+    __slots__ = ("parts", "first", "last", "closed", "arrived")
+
+    def __init__(self, update, now):
+        self.parts = [update.message.text]
+        self.first = self.last = now
+        self.closed = False
+        self.arrived = asyncio.Event()
+
+    def close(self) -> None:
+        self.closed = True
+        self.arrived.set()
+
+
+class MessageDebouncer:
+    """Merges the text messages a chat sends within ``window`` seconds of each other.
+
+    Users often split a question across several quick messages. The first text
+    message of a chat opens a batch and leads it; text messages arriving while
+    the batch is open are appended to it and not processed on their own. The
+    leader is processed once the chat has been quiet for ``window`` seconds, or
+    ``max_wait`` seconds after it arrived, whichever comes first, with
+    ``text(update)`` returning the merged question. A lone message is therefore
+    delayed by at most ``window``.
+
+    ``PerChatUpdateProcessor`` calls ``absorb`` before an update waits for its
+    chat and ``settle`` once the chat is free, so a batch keeps collecting while
+    the chat's previous message is still being answered.
+    """
+
+    def __init__(self, window=debounce_window, max_wait=debounce_max_wait):
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self._batches = {}    # chat key -> open _Batch
+        self._leading = {}    # update_id of the first message -> its _Batch
+        self._merged = {}     # update_id of the first message -> merged text
+        self.merged = 0
+
+    @staticmethod
+    def mergeable(update) -> bool:
+        """Tells whether the update is a plain text message (not a command)."""
+        message = getattr(update, "message", None)
+        text = getattr(message, "text", None)
+        return bool(text) and not text.startswith("/")
+
+    def absorb(self, key, update) -> bool:
+        """Adds a text message to the chat's open batch, if it arrived within
+        ``window`` seconds of the batch's last message and ``max_wait`` of its first.
+
+        :return: True if the update was merged and must not be processed; False
+            if it must (it leads a new batch or is not a text message).
+        """
+        if not self.mergeable(update):
+            # Anything else closes the batch, so it is answered before it.
+            batch = self._batches.pop(key, None)
+            if batch is not None:
+                batch.close()
+            return False
+        now = asyncio.get_running_loop().time()
+        batch = self._batches.get(key)
+        if batch is not None and (now - batch.last > self.window
+                                  or now - batch.first > self.max_wait):
+            # Too late for the open batch (its leader may still be waiting for
+            # the chat): close it and lead a new one.
+            del self._batches[key]
+            batch.close()
+            batch = None
+        if batch is None:
+            self._batches[key] = self._leading[update.update_id] = _Batch(update, now)
+            return False
+        batch.parts.append(update.message.text)
+        batch.last = now
+        batch.arrived.set()
+        self.merged += 1
+        metrics.count("debounced_messages")
+        return True
+
+    async def settle(self, key, update) -> None:
+        """Waits until the batch led by ``update`` is complete and closes it."""
+        batch = self._leading.pop(update.update_id, None)
+        if batch is None:
+            return
+        loop = asyncio.get_running_loop()
+        while not batch.closed:
+            timeout = min(batch.last + self.window, batch.first + self.max_wait) - loop.time()
+            if timeout <= 0:
+                break
+            batch.arrived.clear()
+            try:
+                await asyncio.wait_for(batch.arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        batch.closed = True
+        if len(batch.parts) > 1:
+            self._merged[update.update_id] = "\n".join(batch.parts)
+
+    def text(self, update) -> str:
+        """Returns the question to answer for ``update``: the merged text when it
+        led a batch of several messages, else its own text. Call it once."""
+        return self._merged.pop(update.update_id, update.message.text)
+
+    def stats(self) -> dict:
+        """Returns how many messages were merged into an earlier one."""
+        return {"merged": self.merged, "open": len(self._batches)}
+
+
+message_debouncer = MessageDebouncer()
@@ -3,20 +3,51 @@ handlers.py
 Handlers for the bot.
 """
 
-import time
-import datetime
+import asyncio
+import logging
+import random
 from telegram.ext import CallbackContext
 from telegram import Update
-from openai import OpenAI
+from openai import BadRequestError, NotFoundError
 
-from .config import assistant_id, client_api_key
-from .utils import get_message_count, update_message_count, save_qa
-from .logs.config_logger import LoggerConfigurator
+from .answer_cache import (
+    answer_cache, normalize_question, TOO_SLOW, NO_VALID_RESPONSE, RETRIEVAL_ERROR, UNAVAILABLE,
+)
+from .config import (
+    assistant_id, similarity_matching, streaming_enabled, poll_max_deadline,
+    log_payloads, run_log_sample_rate, admin_ids,
+)
+from .counter import message_counter
+from .debounce import message_debouncer
+from . import http_clients
+from .http_clients import create_openai_client
+from .metrics import metrics
+from .polling import adaptive_poller
+from .quota import quota_manager, format_retry_after
+from .resilience import assistants_api, CircuitOpenError
+from .similarity import similarity_index
+from .single_flight import in_flight_answers
+from .streaming import StreamingReply
+from .thread_store import thread_store
+from .utils import save_qa
+from .work_queue import work_queue, Overloaded
 
-# Configuración del logger al inicio del script
-logger = LoggerConfigurator().configure()
+logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=client_api_key)
+# Created by ``init_client`` when the application is built, so importing this
+# module opens nothing; the benchmark replaces it with a fake.
+client = None
+
+# Run cancellations in progress, referenced until they finish.
+_cancellations = set()
+
+
+def init_client():
+    """Creates the OpenAI client unless there already is one, and returns it."""
+    global client  # pylint: disable=global-statement
+    if client is None:
+        client = create_openai_client()
+    return client
 
 
 async def start(update: Update, context: CallbackContext) -> None:
@@ -34,99 +65,496 @@ async def help_command(update: Update, context: CallbackContext) -> None:
     )
 
 
-def get_answer(message_str) -> str:
-    """Get answer from assistant with detailed logging of run details."""
+async def reset_command(update: Update, context: CallbackContext) -> None:
+    """Starts a new conversation thread for the user."""
+    thread_store.reset(update.effective_user.id)
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="Conversation reset. Your next message starts a new one.",
+    )
+
+
+async def stats_command(update: Update, context: CallbackContext) -> None:
+    """Sends latency and usage metrics; only available to the admins."""
+    if update.effective_user.id not in admin_ids:
+        return
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=metrics.summary({
+            "Answer cache": answer_cache.stats(),
+            "Similarity": similarity_index.stats(),
+            "Coalesced runs": in_flight_answers.stats(),
+            "Debounce": message_debouncer.stats(),
+            "Work queue": work_queue.stats(),
+            "Circuit breaker": {"state": assistants_api.breaker.state,
+                                "failures": assistants_api.breaker.failures},
+            "Daily messages": {"count": message_counter.count},
+            "Threads": {"active": len(thread_store)},
+            "Assistant": {"name": getattr(http_clients.assistant_info, "name", None),
+                          "model": getattr(http_clients.assistant_info, "model", None)},
+        }),
+    )
+
+
+class AnswerError(Exception):
+    """Raised when the assistant could not answer; the message is shown to the user."""
+
+
+
+def is_run_active_error(error) -> bool:
+    """Tells whether ``error`` is the 400 OpenAI returns when a message is added
+    to a thread that still has an active run."""
+    return isinstance(error, BadRequestError) and "while a run" in str(error)
+
+
+async def cancel_run(thread_id, run_id) -> None:
+    """Cancels a run that will not be waited for, so its thread accepts new
+    messages. Best effort: a failure is only logged."""
     try:
-        thread = client.beta.threads.create()
-        logger.info(f"Thread created: ID={thread.id}")
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        metrics.count("runs_cancelled")
+        logger.info("Run cancelled: ID=%s, Thread ID=%s", run_id, thread_id)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.warning("Could not cancel run %s: %s", run_id, e)
+
 
-        # Enviar el mensaje inicial al hilo
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id, role="user", content=message_str
+def cancel_run_soon(thread_id, run_id) -> None:
+    """Starts ``cancel_run`` in the background; usable while being cancelled."""
+    task = asyncio.ensure_future(cancel_run(thread_id, run_id))
+    _cancellations.add(task)
+    task.add_done_callback(_cancellations.discard)
+
+
+async def post_message(message_str, telegram_id=None) -> str:
+    """Adds the question to the user's thread, creating the thread if needed.
+
+    A new thread is also started when the user's thread still has an active
+    run, e.g. one that timed out or a question from another chat of the same
+    user being answered.
+
+    :return: The thread id.
+    """
+    thread_id = thread_store.get(telegram_id) if telegram_id is not None else None
+    if thread_id is not None:
+        try:
+            with metrics.timer("message_post"):
+                message = await assistants_api.call(
+                    lambda: client.beta.threads.messages.create(
+                        thread_id=thread_id, role="user", content=message_str
+                    ),
+                    idempotent=False,
+                )
+            logger.debug("Message sent: ID=%s, Thread ID=%s", message.id, thread_id)
+            return thread_id
+        except NotFoundError:
+            metrics.count("thread_lost")
+            logger.info("Thread %s no longer exists; creating a new one.", thread_id)
+        except BadRequestError as e:
+            if not is_run_active_error(e):
+                raise
+            metrics.count("thread_busy")
+            logger.info("Thread %s has an active run; creating a new one.", thread_id)
+
+    with metrics.timer("thread_create"):
+        thread = await assistants_api.call(client.beta.threads.create, idempotent=False)
+    logger.info("Thread created: ID=%s", thread.id)
+    if telegram_id is not None:
+        thread_store.set(telegram_id, thread.id)
+
+    # Enviar el mensaje inicial al hilo
+    with metrics.timer("message_post"):
+        message = await assistants_api.call(
+            lambda: client.beta.threads.messages.create(
+                thread_id=thread.id, role="user", content=message_str
+            ),
+            idempotent=False,
         )
-        logger.info(f"Message sent: ID={message.id}, Content={message_str}")
+    if log_payloads:
+        logger.debug("Message sent: ID=%s, Content=%s", message.id, message_str)
+    else:
+        logger.debug("Message sent: ID=%s, %d characters", message.id, len(message_str))
+    return thread.id
+
+
+def log_run_details(run, attempt) -> None:
+    """Logs one poll of a run as a single structured DEBUG record."""
+    logger.debug(
+        "Run poll: %s",
+        {
+            "attempt": attempt,
+            "run_id": run.id,
+            "assistant_id": run.assistant_id,
+            "status": run.status,
+            "model": run.model,
+            "instructions": run.instructions,
+            "created_at": run.created_at,
+            "started_at": run.started_at,
+            "completed_at": run.completed_at,
+            "failed_at": run.failed_at,
+            "cancelled_at": run.cancelled_at,
+            "expires_at": run.expires_at,
+            "temperature": run.temperature,
+            "top_p": run.top_p,
+            "response_format": getattr(run.response_format, "type", run.response_format),
+            "truncation_strategy": getattr(run.truncation_strategy, "type", None),
+            "parallel_tool_calls": run.parallel_tool_calls,
+            "tools": [tool.type for tool in run.tools],
+        },
+    )
+
 
-        # Crear una ejecución (run) del asistente
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id,
+async def ask_assistant(message_str, telegram_id=None) -> str:
+    """Runs the assistant on a question and returns its answer.
+
+    With a ``telegram_id`` the question goes to the user's persistent thread,
+    so follow-ups keep the conversation context and skip creating a thread.
+    Every OpenAI call is awaited and polling sleeps with ``asyncio.sleep``, so a
+    slow run only suspends this coroutine and never blocks the event loop.
+    Calls go through ``assistants_api``: creating the thread, the message and
+    the run is attempted once, while polls and the final listing are retried on
+    transient errors.
+
+    :raises AnswerError: If the run did not produce an answer.
+    """
+    thread_id = await post_message(message_str, telegram_id)
+
+    # Crear una ejecución (run) del asistente
+    with metrics.timer("run_create"):
+        run = await assistants_api.call(
+            lambda: client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+            ),
+            idempotent=False,
         )
-        logger.info(f"Run started: ID={run.id}, Status={run.status}")
-
-        # Polling para obtener la respuesta
-        max_attempts = 10
-        attempt = 0
-
-        while attempt < max_attempts:
-            run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-            logger.info(f"Attempt {attempt}: Run Status={run.status}, Run ID={run.id}")
-
-            # Descomponer los detalles del objeto 'run'
-            logger.info(f"Run ID: {run.id}")
-            logger.info(f"Assistant ID: {run.assistant_id}")
-            logger.info(f"Status: {run.status}")
-            logger.info(f"Instructions: {run.instructions}")
-            logger.info(f"Model: {run.model}")
-            logger.info(f"Created At: {run.created_at}")
-            logger.info(f"Started At: {run.started_at}")
-            logger.info(f"Completed At: {run.completed_at}")
-            logger.info(f"Failed At: {run.failed_at}")
-            logger.info(f"Cancelled At: {run.cancelled_at}")
-            logger.info(f"Expires At: {run.expires_at}")
-            logger.info(f"Temperature: {run.temperature}")
-            logger.info(f"Top P: {run.top_p}")
-            logger.info(f"Response Format: {run.response_format.type}")
-            logger.info(f"Truncation Strategy: {run.truncation_strategy.type}")
-            logger.info(f"Parallel Tool Calls: {run.parallel_tool_calls}")
-            logger.info(f"Tools: {[tool.type for tool in run.tools]}")
+    logger.debug("Run started: ID=%s, Status=%s", run.id, run.status)
+
+    # Polling para obtener la respuesta
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    poll_key = (assistant_id, run.model)
+    attempt = 0
+    last_pending = 0.0
+    finished = False
+    try:
+        for delay in adaptive_poller.delays(poll_key):
+            await asyncio.sleep(delay)
+            with metrics.timer("run_poll"):
+                run = await assistants_api.call(
+                    lambda: client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+                )
+            elapsed = loop.time() - started
+            if (log_payloads and logger.isEnabledFor(logging.DEBUG)
+                    and random.random() < run_log_sample_rate):
+                log_run_details(run, attempt)
 
             if run.status == "completed":
-                logger.info(f"Run completed successfully: Run ID={run.id}")
+                finished = True
+                # The run finished between the previous poll and this one; recording
+                # the midpoint keeps the estimate from creeping up with the schedule.
+                adaptive_poller.record(poll_key, (last_pending + elapsed) / 2)
+                metrics.observe("run_wait", elapsed)
+                metrics.count("run_polls", attempt + 1)
+                metrics.count("runs_completed")
+                logger.info("Run completed: ID=%s, polls=%d, elapsed=%.2fs",
+                            run.id, attempt + 1, elapsed)
                 break
-
-            time.sleep(1)
+            if run.status in ("failed", "cancelled", "expired"):
+                finished = True
+                metrics.count(f"runs_{run.status}")
+                logger.error("Run ended with status %s: Run ID=%s", run.status, run.id)
+                raise AnswerError(NO_VALID_RESPONSE)
+            last_pending = elapsed
             attempt += 1
+        else:
+            # Count the timeout as a slow run so the deadline adapts upwards.
+            adaptive_poller.record(poll_key, loop.time() - started)
+            metrics.count("runs_timed_out")
+            logger.error("Run did not complete after %d polls: Run ID=%s", attempt, run.id)
+            raise AnswerError(TOO_SLOW)
+    finally:
+        if not finished:
+            # Timed out or cancelled: stop the run so the thread accepts the
+            # user's next message.
+            cancel_run_soon(thread_id, run.id)
+
+    # Obtener los mensajes del hilo
+    with metrics.timer("message_list"):
+        messages = await assistants_api.call(
+            lambda: client.beta.threads.messages.list(
+                thread_id=thread_id, run_id=run.id, limit=1
+            )
+        )
+    if not messages.dict() or not messages.dict().get("data"):
+        logger.error("Received empty or invalid response from OpenAI API.")
+        raise AnswerError(NO_VALID_RESPONSE)
+
+    response = messages.dict()["data"][0]["content"][0]["text"]["value"]
+    if log_payloads:
+        logger.debug("Response received: %s", response)
+    else:
+        logger.debug("Response received: %d characters", len(response))
 
-        if attempt == max_attempts:
-            logger.error(f"Run did not complete after {max_attempts} attempts: Run ID={run.id}")
-            return "Sorry, the response took too long."
+    return response
 
-        # Obtener los mensajes del hilo
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        if not messages.dict() or not messages.dict().get("data"):
-            logger.error("Received empty or invalid response from OpenAI API.")
-            return "Sorry, I couldn't get a valid response."
 
-        response = messages.dict()["data"][0]["content"][0]["text"]["value"]
-        logger.info(f"Response received: {response}")
+def is_standalone(telegram_id) -> bool:
+    """Tells whether a message from this user starts a conversation.
 
-        return response
+    Cached and historical answers carry no conversation context, so they are
+    only used for such messages; follow-ups in a live thread always go to the
+    assistant.
+    """
+    return telegram_id is None or telegram_id not in thread_store
 
+
+def recall_answer(message_str):
+    """Returns a stored answer from the answer cache or, when similarity matching
+    is enabled, for a paraphrase from the history; None if there is none."""
+    cached = answer_cache.get(assistant_id, message_str)
+    if cached is not None:
+        metrics.count("answer_cache_hits")
+        return cached
+    if similarity_matching:
+        match = similarity_index.lookup(message_str)
+        if match is not None:
+            metrics.count("similarity_hits")
+            logger.info("Answered from history (similarity %.2f).", match[1])
+            return match[0]
+    return None
+
+
+def remember_answer(message_str, answer) -> None:
+    """Makes a fresh answer available to later identical or similar questions."""
+    answer_cache.put(assistant_id, message_str, answer)
+    if similarity_matching:
+        similarity_index.add(message_str, answer)
+
+
+def flight_key(message_str):
+    """Key under which identical standalone questions share one assistant run."""
+    return assistant_id, normalize_question(message_str)
+
+
+def join_or_start(message_str, ask):
+    """Returns the answer of the run already in flight for this question, or of
+    ``ask()``, a new run whose answer is remembered when it completes.
+
+    Broadcasts make many users send the same question at once; they all wait
+    for a single run instead of starting one each.
+    """
+    key = flight_key(message_str)
+    if key in in_flight_answers:
+        metrics.count("coalesced_questions")
+
+    async def ask_and_remember():
+        answer = await ask()
+        remember_answer(message_str, answer)
+        return answer
+
+    return in_flight_answers.do(key, ask_and_remember)
+
+
+async def get_answer(message_str, telegram_id=None) -> str:
+    """Get answer from assistant, serving repeated questions from the answer cache
+    and, when similarity matching is enabled, paraphrases from the history.
+    Identical standalone questions asked at the same time share one run."""
+    standalone = is_standalone(telegram_id)
+    if standalone:
+        recalled = recall_answer(message_str)
+        if recalled is not None:
+            return recalled
+    try:
+        with metrics.timer("assistant"):
+            if standalone:
+                answer = await join_or_start(
+                    message_str, lambda: ask_assistant(message_str, telegram_id)
+                )
+            else:
+                answer = await ask_assistant(message_str, telegram_id)
+    except AnswerError as e:
+        metrics.count("answer_errors")
+        return str(e)
+    except CircuitOpenError:
+        metrics.count("breaker_rejected")
+        return UNAVAILABLE
     except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        return "Sorry, an error occurred while retrieving the answer."
+        metrics.count("unexpected_errors")
+        logger.error("An error occurred: %s", e)
+        return RETRIEVAL_ERROR
+    return answer
+
+
+async def stream_assistant(message_str, telegram_id, on_text) -> str:
+    """Runs the assistant consuming the run's event stream.
 
+    ``on_text`` is called with every text fragment as it arrives.
 
+    :return: The complete answer.
+    :raises AnswerError: If the run did not produce an answer.
+    """
+    thread_id = await post_message(message_str, telegram_id)
+    parts = []
+    run_id = None
+    finished = False
+    try:
+        async with assistants_api.guarded(), client.beta.threads.runs.stream(
+            thread_id=thread_id, assistant_id=assistant_id
+        ) as stream:
+            async for event in stream:
+                if event.event == "thread.run.created":
+                    run_id = event.data.id
+                elif event.event == "thread.message.delta":
+                    for block in event.data.delta.content or []:
+                        if block.type == "text" and block.text and block.text.value:
+                            parts.append(block.text.value)
+                            on_text(block.text.value)
+                elif event.event == "thread.run.completed":
+                    finished = True
+                elif event.event in ("thread.run.failed", "thread.run.cancelled",
+                                     "thread.run.expired", "error"):
+                    finished = True
+                    logger.error("Streamed run ended with event %s.", event.event)
+                    raise AnswerError(NO_VALID_RESPONSE)
+    finally:
+        if run_id is not None and not finished:
+            # The stream was cut short (timeout, cancellation, network error):
+            # stop the run so the thread accepts the user's next message.
+            cancel_run_soon(thread_id, run_id)
+    if not parts:
+        raise AnswerError(NO_VALID_RESPONSE)
+    return "".join(parts)
+
+
+async def stream_with_deadline(message_str, telegram_id, on_text) -> str:
+    """``stream_assistant`` bounded by ``poll_max_deadline``.
+
+    The deadline applies inside the call, which may be shared by several
+    chats: past it the stream is closed and the run cancelled, whoever waits.
+
+    :raises AnswerError: If the run did not produce an answer in time.
+    """
+    try:
+        return await asyncio.wait_for(
+            stream_assistant(message_str, telegram_id, on_text), poll_max_deadline
+        )
+    except asyncio.TimeoutError:
+        metrics.count("runs_timed_out")
+        raise AnswerError(TOO_SLOW) from None
+
+
+async def stream_answer(message_str, telegram_id, bot, chat_id) -> str:
+    """Sends the answer to the chat while it is generated.
+
+    :return: The final answer text, as stored in the history.
+    """
+    standalone = is_standalone(telegram_id)
+    if standalone:
+        recalled = recall_answer(message_str)
+        if recalled is not None:
+            with metrics.timer("telegram_send"):
+                await bot.send_message(chat_id=chat_id, text=recalled)
+            return recalled
+        if flight_key(message_str) in in_flight_answers:
+            # Another user's run is already answering this question; wait for
+            # it rather than streaming a second one.
+            answer = await get_answer(message_str, telegram_id)
+            with metrics.timer("telegram_send"):
+                await bot.send_message(chat_id=chat_id, text=answer)
+            return answer
+
+    reply = StreamingReply(bot, chat_id)
+    await reply.start()
+    try:
+        with metrics.timer("assistant_stream"):
+            if standalone:
+                answer = await join_or_start(
+                    message_str, lambda: stream_with_deadline(message_str, telegram_id, reply.feed)
+                )
+            else:
+                answer = await stream_with_deadline(message_str, telegram_id, reply.feed)
+    except AnswerError as e:
+        metrics.count("answer_errors")
+        answer = str(e)
+    except CircuitOpenError:
+        metrics.count("breaker_rejected")
+        answer = UNAVAILABLE
+    except Exception as e:
+        metrics.count("unexpected_errors")
+        logger.error("An error occurred: %s", e)
+        answer = RETRIEVAL_ERROR
+    else:
+        if not reply.text:
+            # The question joined a run that streams into another chat.
+            reply.feed(answer)
+        await reply.finish()
+        return answer
+    await reply.finish(error=answer)
+    return answer
+
+
+metrics.gauge("work_queue_depth", lambda: work_queue.depth)
+metrics.gauge("work_queue_active", lambda: work_queue.active)
+metrics.gauge("breaker_open", lambda: int(assistants_api.breaker.state != "closed"))
 
 
 async def process_message(update: Update, context: CallbackContext) -> None:
-    """Processes a message from the user, gets an answer, and sends it back."""
-    message_data = get_message_count()
-    count = message_data["count"]
-    date = message_data["date"]
-    today = str(datetime.date.today())
-
-    if date != today:
-        count = 0
-    if count >= 100:
+    """Processes a message from the user, gets an answer, and sends it back.
+
+    The answer is produced inside a ``work_queue`` slot; when the bot is over
+    capacity the user is told to try again instead. The question includes the
+    messages the debouncer merged into this one.
+    """
+    message_str = message_debouncer.text(update)
+    metrics.count("messages_received")
+    retry_after = quota_manager.check(update.effective_user.id)
+    if retry_after:
+        metrics.count("quota_rejected")
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="You're sending messages too quickly. "
+            f"Please try again in {format_retry_after(retry_after)}.",
+        )
+        return
+
+    queued = asyncio.get_running_loop().time()
+    try:
+        async with work_queue.slot(queued):
+            metrics.observe("queue_wait", asyncio.get_running_loop().time() - queued)
+            await answer_message(update, context, message_str)
+    except Overloaded as e:
+        metrics.count(f"shed_{e.reason}")
+        logger.warning("Shedding message from %s (%s).", update.effective_user.id, e.reason)
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="The assistant is busy right now. Please try again in a moment.",
+        )
+
+
+async def answer_message(update: Update, context: CallbackContext, message_str) -> None:
+    """Answers an admitted message and records the exchange."""
+    if not message_counter.try_increment():
+        metrics.count("daily_limit_rejected")
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="The daily message limit has been reached. Please try again tomorrow.",
+        )
         return
 
-    answer = get_answer(update.message.text)
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=answer)
-    update_message_count(count + 1)
+    with metrics.timer("message_total"):
+        if streaming_enabled:
+            answer = await stream_answer(
+                message_str, update.effective_user.id, context.bot,
+                update.effective_chat.id,
+            )
+        else:
+            answer = await get_answer(message_str, update.effective_user.id)
+            with metrics.timer("telegram_send"):
+                await context.bot.send_message(chat_id=update.effective_chat.id, text=answer)
     save_qa(
         update.effective_user.id,
         update.effective_user.username,
-        update.message.text,
+        message_str,
         answer,
+        assistant_id,
     )
@@ -0,0 +1,124 @@
+"""
+http_clients.py
+Tuned HTTP clients for the OpenAI and Telegram APIs, and startup pre-warming.
+"""
+
+import asyncio
+import importlib.util
+import logging
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout
+from telegram.request import HTTPXRequest
+
+from .config import (
+    assistant_id, client_api_key, openai_max_connections, openai_timeout,
+    openai_connect_timeout, telegram_max_connections, telegram_read_timeout,
+    telegram_write_timeout, telegram_connect_timeout, telegram_pool_timeout,
+    http_keepalive_expiry, http2, prewarm_connections,
+)
+
+logger = logging.getLogger(__name__)
+
+# Metadata of the assistant (name, model...), fetched once by ``prewarm`` and
+# shown by /stats; None until then or if the lookup failed.
+assistant_info = None
+
+
+def http2_enabled(setting=http2) -> bool:
+    """Tells whether to use HTTP/2: always with "true", never with "false", and
+    with "auto" when the ``h2`` package httpx needs for it is installed."""
+    if setting in ("1", "true", "yes"):
+        return True
+    if setting in ("0", "false", "no"):
+        return False
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_openai_client(max_connections=openai_max_connections, use_http2=None, **kwargs):
+    """Returns an ``AsyncOpenAI`` client with a sized, long-lived connection pool.
+
+    The library's default pool closes connections after 5 idle seconds, so a
+    quiet bot pays a new TLS handshake on most messages; here idle connections
+    live for ``HTTP_KEEPALIVE_EXPIRY`` seconds. The library's own retries are
+    disabled: ``resilience.assistants_api`` retries the calls that are safe to
+    repeat. Extra ``kwargs`` go to ``AsyncOpenAI`` (e.g. ``base_url``).
+    """
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=http_keepalive_expiry,
+        ),
+        http2=http2_enabled() if use_http2 is None else use_http2,
+    )
+    return AsyncOpenAI(
+        api_key=client_api_key,
+        http_client=http_client,
+        timeout=Timeout(openai_timeout, connect=openai_connect_timeout),
+        max_retries=0,
+        **kwargs,
+    )
+
+
+class KeepAliveHTTPXRequest(HTTPXRequest):
+    """``HTTPXRequest`` whose idle connections live for ``keepalive_expiry`` seconds
+    instead of httpx's default 5."""
+
+    __slots__ = ("keepalive_expiry",)
+
+    def __init__(self, *args, keepalive_expiry=http_keepalive_expiry, **kwargs):
+        self.keepalive_expiry = keepalive_expiry
+        super().__init__(*args, **kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = self._client_kwargs["limits"]
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        return super()._build_client()
+
+
+def create_telegram_request(max_connections=telegram_max_connections, use_http2=None):
+    """Returns the request object the bot uses for every call but getUpdates."""
+    return KeepAliveHTTPXRequest(
+        connection_pool_size=max_connections,
+        read_timeout=telegram_read_timeout,
+        write_timeout=telegram_write_timeout,
+        connect_timeout=telegram_connect_timeout,
+        pool_timeout=telegram_pool_timeout,
+        http_version="2" if (http2_enabled() if use_http2 is None else use_http2) else "1.1",
+    )
+
+
+async def prewarm(bot, client, connections=prewarm_connections) -> None:
+    """Opens connections to both APIs before the first message arrives.
+
+    Concurrent requests make each pool resolve DNS and complete TLS handshakes
+    for up to ``connections`` connections, which then stay alive for the first
+    messages: ``getMe`` calls for Telegram and, for OpenAI, one lookup of the
+    assistant, kept in ``assistant_info``, plus plain ``GET /models`` requests
+    whose responses are not even parsed. Failures are logged; the bot starts
+    anyway.
+    """
+    global assistant_info  # pylint: disable=global-statement
+    if connections <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await asyncio.gather(
+        client.beta.assistants.retrieve(assistant_id),
+        *(client.get("/models", cast_to=httpx.Response) for _ in range(connections - 1)),
+        *(bot.get_me() for _ in range(connections)),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.warning("%d pre-warming requests failed, e.g.: %s", len(errors), errors[0])
+    if not isinstance(results[0], Exception):
+        assistant_info = results[0]
+        logger.info("Assistant %s: %s (%s).", assistant_id, getattr(assistant_info, "name", None),
+                    getattr(assistant_info, "model", None))
+    logger.info("Connections pre-warmed in %.2fs.", loop.time() - started)
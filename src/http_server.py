@@ -0,0 +1,135 @@
+"""
+http_server.py
+Minimal asyncio HTTP/1.1 server for the bot's local endpoints.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    """Ends the request with ``status``."""
+
+    def __init__(self, status, message=""):
+        super().__init__(message or REASONS.get(status, ""))
+        self.status = status
+
+
+class HTTPServer:
+    """Serves small HTTP requests with keep-alive, without external dependencies.
+
+    Subclasses implement ``handle``. Connections are kept open between requests
+    (Telegram reuses its webhook connections), and requests with a body larger
+    than ``max_body`` bytes are rejected.
+    """
+
+    name = "HTTP server"
+    idle_timeout = 60.0
+    max_body = 1024 * 1024
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._connections = {}   # writer -> task serving the connection
+
+    async def handle(self, method, path, headers, body):
+        """Answers one request.
+
+        :param headers: Header names are lower case.
+        :return: ``(status, body bytes, content type)``.
+        :raises HTTPError: To answer with an error status.
+        """
+        raise NotImplementedError
+
+    async def _read_request(self, reader):
+        request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise HTTPError(400)
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError as e:
+            raise HTTPError(400) from e
+        if length > self.max_body:
+            raise HTTPError(413)
+        body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout) if length else b""
+        return parts[0], parts[1], parts[2], headers, body
+
+    @staticmethod
+    def _write_response(writer, status, body, content_type, keep_alive) -> None:
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+            + body
+        )
+
+    async def _serve_connection(self, reader, writer) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    self._write_response(writer, e.status, str(e).encode(), "text/plain", False)
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                method, path, version, headers, body = request
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version == "HTTP/1.1")
+                try:
+                    status, payload, content_type = await self.handle(method, path, headers, body)
+                except HTTPError as e:
+                    status, payload, content_type = e.status, str(e).encode(), "text/plain"
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.error("%s failed to handle %s %s: %s", self.name, method, path, e)
+                    status, payload, content_type = 500, b"", "text/plain"
+                self._write_response(writer, status, payload, content_type, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def start(self) -> None:
+        """Starts listening."""
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("%s listening on %s:%s", self.name, self.host, self.port)
+
+    async def stop(self) -> None:
+        """Stops listening."""
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise stay open; closing
+            # them makes their tasks see EOF and finish.
+            tasks = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
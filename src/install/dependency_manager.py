@@ -4,9 +4,17 @@ Este módulo proporciona clases para la gestión de dependencias, incluyendo la
 la instalación de dependencias y la verificación de dependencias faltantes.
 """
 
+import os
+import re
 import subprocess
 import sys
 from abc import ABC, abstractmethod
+from importlib import metadata
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+except ImportError:  # packaging no está instalado: se usa el analizador simple
+    Requirement = None
 
 class Updater(ABC):
     """
@@ -37,6 +45,133 @@ class PipUpdater(Updater):
             print(f"No se pudo actualizar pip. Error: {e}")
 
 
+def read_requirements(requirements_file: str) -> list:
+    """
+    Lee las dependencias de un archivo requirements.txt.
+
+    Se ignoran las líneas vacías, los comentarios y las opciones de pip
+    (por ejemplo `-r` o `--index-url`).
+
+    :param requirements_file: Ruta al archivo requirements.txt.
+    :return: Lista de especificaciones de dependencias, en el orden del archivo.
+    """
+    with open(requirements_file, 'r', encoding='utf-8') as file:
+        lines = (line.split(' #', 1)[0].strip() for line in file)
+        return [line for line in lines if line and not line.startswith(('#', '-'))]
+
+
+_SIMPLE_REQUIREMENT = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^\]]*\])?\s*([^;]*)")
+_SIMPLE_CLAUSE = re.compile(r"^(===|==|!=|~=|<=|>=|<|>)\s*(\S+)$")
+_SIMPLE_PLATFORM_MARKER = re.compile(r"^sys_platform\s*(==|!=)\s*['\"]([^'\"]*)['\"]$")
+
+
+def _release(version: str) -> tuple:
+    """Devuelve la parte numérica de una versión como tupla: `1.4.0rc1` da `(1, 4, 0)`."""
+    release = []
+    for part in version.split('.'):
+        digits = re.match(r"\d+", part)
+        if not digits:
+            break
+        release.append(int(digits.group()))
+    return tuple(release)
+
+
+def _simple_satisfies(installed: str, specifier: str) -> bool:
+    """
+    Compara una versión instalada con especificadores como `==1.2`, `>=1.0,<2`
+    o `~=1.4`, sin depender de `packaging`. Solo tiene en cuenta la parte
+    numérica de las versiones.
+    """
+    def key(release):
+        # 1.0 y 1 son la misma versión.
+        release = list(release)
+        while release and release[-1] == 0:
+            release.pop()
+        return tuple(release)
+
+    def starts_with(release, prefix):
+        return (release + (0,) * len(prefix))[:len(prefix)] == prefix
+
+    current = _release(installed)
+    for clause in filter(None, (c.strip() for c in specifier.split(','))):
+        match = _SIMPLE_CLAUSE.match(clause)
+        if not match:
+            return False
+        operator, version = match.groups()
+        if operator in ('==', '!=') and version.endswith('.*'):
+            if starts_with(current, _release(version[:-2])) != (operator == '=='):
+                return False
+            continue
+        wanted = _release(version)
+        if operator == '~=':
+            if key(current) < key(wanted) or not starts_with(current, wanted[:-1]):
+                return False
+        elif not {
+            '==': key(current) == key(wanted), '===': installed == version,
+            '!=': key(current) != key(wanted),
+            '<=': key(current) <= key(wanted), '>=': key(current) >= key(wanted),
+            '<': key(current) < key(wanted), '>': key(current) > key(wanted),
+        }[operator]:
+            return False
+    return True
+
+
+class DependencyChecker(ABC):
+    """
+    Interfaz para verificar qué dependencias ya están instaladas.
+    Las clases que hereden de esta deberán implementar el método `missing`.
+    """
+    @abstractmethod
+    def missing(self, dependencies: list) -> list:
+        """Devuelve las dependencias que no están instaladas o no cumplen la versión."""
+
+
+class MetadataDependencyChecker(DependencyChecker):
+    """
+    Verifica las dependencias con `importlib.metadata`, leyendo los metadatos de
+    los paquetes instalados en el intérprete actual: no lanza ningún proceso,
+    por lo que revisar todo requirements.txt tarda milisegundos.
+
+    Con `packaging` instalado se respetan todos los especificadores y los
+    marcadores de entorno (por ejemplo `; sys_platform == "win32"`); sin él se
+    comparan solo las versiones numéricas, y de los marcadores solo se evalúan
+    los de la forma `sys_platform == "..."` o `sys_platform != "..."`.
+    """
+    def is_satisfied(self, dependency: str) -> bool:
+        """
+        Indica si una dependencia está instalada con una versión aceptable.
+
+        :param dependency: Especificación de la dependencia, por ejemplo `colorlog==6.6.0`.
+        :return: True si no hace falta instalarla.
+        """
+        if Requirement is not None:
+            try:
+                requirement = Requirement(dependency)
+            except InvalidRequirement:
+                return False
+            if requirement.marker is not None and not requirement.marker.evaluate():
+                return True  # No aplica a esta plataforma
+            name, specifier = requirement.name, requirement.specifier
+        else:
+            match = _SIMPLE_REQUIREMENT.match(dependency)
+            if not match:
+                return False
+            marker = _SIMPLE_PLATFORM_MARKER.match(dependency.partition(';')[2].strip())
+            if marker and (sys.platform == marker.group(2)) != (marker.group(1) == '=='):
+                return True  # No aplica a esta plataforma
+            name, specifier = match.group(1), match.group(2).strip()
+        try:
+            installed = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            return False
+        if Requirement is not None:
+            return specifier.contains(installed, prereleases=True)
+        return _simple_satisfies(installed, specifier)
+
+    def missing(self, dependencies: list) -> list:
+        return [dep for dep in dependencies if not self.is_satisfied(dep)]
+
+
 class DependencyInstaller(ABC):
     """
     Interfaz para la instalación de dependencias.
@@ -47,12 +182,53 @@ class DependencyInstaller(ABC):
         """Instala una dependencia."""
         print(f"Instalando {dependency}...")
 
+    def install_many(self, dependencies: list) -> bool:
+        """
+        Instala varias dependencias. Por defecto las instala una por una; las
+        subclases pueden hacerlo en una sola invocación.
+
+        :return: True si todas se instalaron, False en caso contrario.
+        """
+        results = [self.install(dep) for dep in dependencies]
+        return all(results)
+
 
 class PipDependencyInstaller(DependencyInstaller):
     """
     Clase concreta que implementa la instalación de dependencias usando pip.
     Implementa la interfaz `DependencyInstaller`.
+
+    pip prefiere las ruedas (wheels) ya compiladas a compilar desde el código
+    fuente. Con `wheelhouse` busca además los paquetes en ese directorio local,
+    y con `offline` solo allí, sin acceder a PyPI; `cache_dir` elige la caché de
+    descargas de pip.
     """
+    def __init__(self, wheelhouse: str = None, cache_dir: str = None, offline: bool = False,
+                 prefer_binary: bool = True):
+        """
+        :param wheelhouse: Directorio con ruedas o paquetes descargados previamente.
+        :param cache_dir: Directorio de caché de pip.
+        :param offline: Instala solo desde `wheelhouse`, sin usar el índice de paquetes.
+        :param prefer_binary: Prefiere versiones con rueda aunque haya otras más nuevas.
+        """
+        self.wheelhouse = wheelhouse
+        self.cache_dir = cache_dir
+        self.offline = offline
+        self.prefer_binary = prefer_binary
+
+    def command(self, dependencies: list) -> list:
+        """Devuelve el comando de pip que instala `dependencies`."""
+        command = [sys.executable, '-m', 'pip', 'install', '--disable-pip-version-check']
+        if self.prefer_binary:
+            command.append('--prefer-binary')
+        if self.wheelhouse and os.path.isdir(self.wheelhouse):
+            command += ['--find-links', self.wheelhouse]
+        if self.offline:
+            command.append('--no-index')
+        if self.cache_dir:
+            command += ['--cache-dir', self.cache_dir]
+        return command + list(dependencies)
+
     def install(self, dependency: str) -> bool:
         """
         Instala una dependencia usando pip.
@@ -60,13 +236,23 @@ class PipDependencyInstaller(DependencyInstaller):
         :param dependency: Nombre de la dependencia a instalar.
         :return: True si la instalación fue exitosa, False en caso contrario.
         """
-        print(f"Instalando {dependency} usando pip...")
+        return self.install_many([dependency])
+
+    def install_many(self, dependencies: list) -> bool:
+        """
+        Instala todas las dependencias con una sola invocación de pip, que las
+        resuelve juntas en lugar de una por una.
+
+        :param dependencies: Especificaciones de las dependencias a instalar.
+        :return: True si la instalación fue exitosa, False en caso contrario.
+        """
+        print(f"Instalando {', '.join(dependencies)} usando pip...")
         try:
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', dependency])
-            print(f"{dependency} instalado correctamente.")
+            subprocess.check_call(self.command(dependencies))
+            print("Dependencias instaladas correctamente.")
             return True
         except subprocess.CalledProcessError as e:
-            print(f"No se pudo instalar {dependency}. Error: {e}")
+            print(f"No se pudieron instalar las dependencias. Error: {e}")
             return False
 
 
@@ -74,55 +260,67 @@ class DependencyInstallerManager:
     """
     Clase responsable de instalar las dependencias faltantes.
     Ahora depende de interfaces en lugar de clases concretas.
+
+    Solo se instalan las dependencias que el verificador da por faltantes, y
+    todas juntas: con requirements.txt ya satisfecho no se lanza ningún proceso.
+    pip instala todo o nada, así que si falla la invocación conjunta las que
+    sigan faltando se instalan una por una: una dependencia que no se puede
+    instalar no impide instalar las demás.
     """
-    def __init__(self, installer: DependencyInstaller, updater: Updater, max_retries: int = 3):
+    def __init__(self, installer: DependencyInstaller, updater: Updater, max_retries: int = 3,
+                 checker: DependencyChecker = None):
         """
         Inicializa la clase DependencyInstallerManager con un instalador y un actualizador.
 
         :param installer: Instancia de una clase que implementa la interfaz DependencyInstaller.
         :param updater: Instancia de una clase que implementa la interfaz Updater.
-        :param max_retries: Número máximo de intentos para instalar cada dependencia.
+        :param max_retries: Número máximo de intentos para instalar una por una las
+            dependencias que la invocación conjunta no instaló.
+        :param checker: Verificador de dependencias instaladas; por defecto
+            `MetadataDependencyChecker`.
         """
         self.installer = installer
         self.updater = updater
         self.max_retries = max_retries
+        self.checker = checker or MetadataDependencyChecker()
 
     def install_missing_dependencies(self, requirements_file: str = 'requirements.txt') -> None:
         """
-        Instala las dependencias faltantes utilizando el instalador proporcionado.
-        Si una instalación falla, se reintentará hasta max_retries veces.
+        Instala las dependencias faltantes utilizando el instalador proporcionado,
+        primero todas juntas. Las que sigan faltando se instalan una por una,
+        hasta max_retries veces, y al final se informa cuáles fallaron.
 
         :param requirements_file: Ruta al archivo requirements.txt que contiene las dependencias.
         """
-        failed_dependencies = []  # Lista para almacenar dependencias que no se pudieron instalar
-
         print(f"Leyendo dependencias desde {requirements_file}...")
 
         try:
-            with open(requirements_file, 'r', encoding='utf-8') as file:
-                dependencies = file.read().splitlines()
+            dependencies = read_requirements(requirements_file)
         except FileNotFoundError:
             print(f"El archivo {requirements_file} no fue encontrado.")
             return
 
-        print(f"Las siguientes dependencias están faltantes: {', '.join(dependencies)}")
-        print("Intentando instalar dependencias faltantes...")
+        missing = self.checker.missing(dependencies)
+        if not missing:
+            print("Todas las dependencias ya están instaladas.")
+            return
 
-        for dep in dependencies:
-            success = False
-            for attempt in range(self.max_retries):
-                print(f"Intentando instalar {dep} (intento {attempt + 1}/{self.max_retries})...")
-                if self.installer.install(dep):
-                    success = True
-                    break
-                print(f"Reintentando instalación de {dep}...")
+        print(f"Las siguientes dependencias están faltantes: {', '.join(missing)}")
+        print("Intentando instalar dependencias faltantes...")
 
-            if not success:
-                print(f"Fallo la instalación de {dep} después de {self.max_retries} intentos.")
-                failed_dependencies.append(dep)
+        self.installer.install_many(missing)
+        missing = self.checker.missing(missing)
+        for attempt in range(self.max_retries):
+            if not missing:
+                break
+            print(f"Instalando una por una {', '.join(missing)} "
+                  f"(intento {attempt + 1}/{self.max_retries})...")
+            for dependency in missing:
+                self.installer.install(dependency)
+            missing = self.checker.missing(missing)
 
-        if failed_dependencies:
+        if missing:
             print("Las siguientes dependencias no pudieron ser instaladas:")
-            print(", ".join(failed_dependencies))
+            print(", ".join(missing))
         else:
             print("Todas las dependencias fueron instaladas exitosamente.")
@@ -3,11 +3,15 @@ src/logs/config_logger.py
 Logger configuration module.
 """
 
+import atexit
 import logging.config
+import logging.handlers
 import os
 import json
+import queue
 from abc import ABC, abstractmethod
-from src.logs.info_error_filter import InfoErrorFilter
+
+from .rotating_handler import CompressingRotatingFileHandler
 
 class ConfigStrategy(ABC):
     """Abstract base class for configuration strategies."""
@@ -33,24 +37,107 @@ class JSONConfigStrategy(ConfigStrategy):
                 return json.load(f)
         return None
 
+class RotatingConfigStrategy(ConfigStrategy):
+    """Makes the file handlers of another strategy's configuration rotate.
+
+    Every ``FileHandler`` or ``RotatingFileHandler`` of the configuration loaded
+    by ``base`` (the JSON file by default) becomes a
+    ``CompressingRotatingFileHandler`` with the given limits, so rotation can be
+    switched on without editing the dictConfig.
+    """
+    FILE_HANDLERS = ("logging.FileHandler", "logging.handlers.RotatingFileHandler")
+
+    def __init__(self, base=None, max_bytes=0, max_age=0, retention_bytes=0, backup_count=0,
+                 compress=True):
+        self.base = base or JSONConfigStrategy()
+        self.options = {
+            "maxBytes": max_bytes,
+            "maxAge": max_age,
+            "retentionBytes": retention_bytes,
+            "backupCount": backup_count,
+            "compress": compress,
+        }
+
+    def load_config(self):
+        """Loads the base configuration and replaces its file handlers."""
+        config = self.base.load_config()
+        if not config:
+            return config
+        handler_class = (f"{CompressingRotatingFileHandler.__module__}."
+                         f"{CompressingRotatingFileHandler.__qualname__}")
+        for handler in config.get("handlers", {}).values():
+            if handler.get("class") in self.FILE_HANDLERS:
+                handler["class"] = handler_class
+                handler.pop("mode", None)
+                handler.update(self.options)
+        return config
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that hands records over unformatted.
+
+    The standard ``QueueHandler`` formats every record in the calling thread so
+    it can be pickled; the listener here is a thread in the same process, so
+    formatting is left to it and logging costs the caller one queue put.
+    """
+
+    def prepare(self, record):
+        return record
+
+
 class LoggerConfigurator:
-    """Configures logging for the application using a strategy pattern."""
-    def __init__(self, config_strategy=None, default_level=logging.INFO):
+    """Configures logging for the application using a strategy pattern.
+
+    Configuration happens once per process: later calls to ``configure`` only
+    return the logger unless ``force`` is given. With ``use_queue`` the handlers
+    built from the configuration are moved behind a ``LazyQueueHandler`` and run
+    by a ``QueueListener`` thread, so file and console I/O never happen on the
+    caller's thread (the bot's event loop).
+    """
+    _configured = False
+    _listeners = []
+
+    def __init__(self, config_strategy=None, default_level=logging.INFO, use_queue=True):
         self.config_strategy = config_strategy or JSONConfigStrategy()
         self.default_level = default_level
+        self.use_queue = use_queue
 
-    def configure(self):
+    def configure(self, force=False):
         """Configures the logger using the provided strategy."""
+        if LoggerConfigurator._configured and not force:
+            return logging.getLogger(__name__)
+        self.shutdown()
         config = self.config_strategy.load_config()
         if config:
             logging.config.dictConfig(config)
+            logger_names = [""] + [name for name in config.get("loggers", {}) if name]
         else:
             logging.basicConfig(level=self.default_level)
             logging.warning("Logging configuration file not found. Using default settings.")
+            logger_names = [""]
+        if self.use_queue:
+            for name in logger_names:
+                self._move_handlers_to_listener(logging.getLogger(name))
+        LoggerConfigurator._configured = True
         return logging.getLogger(__name__)
 
-# Configuración inicial del logger para módulos individuales
-initial_config_strategy = JSONConfigStrategy()
-logger_configurator = LoggerConfigurator(config_strategy=initial_config_strategy)
-logger = logger_configurator.configure()
-logger.addFilter(InfoErrorFilter())  # Aplica el filtro InfoErrorFilter
+    @classmethod
+    def _move_handlers_to_listener(cls, target):
+        handlers = list(target.handlers)
+        if not handlers:
+            return
+        records = queue.SimpleQueue()
+        for handler in handlers:
+            target.removeHandler(handler)
+        target.addHandler(LazyQueueHandler(records))
+        listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        listener.start()
+        cls._listeners.append(listener)
+
+    @classmethod
+    def shutdown(cls):
+        """Stops the listener threads after they write the queued records."""
+        while cls._listeners:
+            cls._listeners.pop().stop()
+
+
+atexit.register(LoggerConfigurator.shutdown)
@@ -0,0 +1,239 @@
+"""
+src/logs/rotating_handler.py
+Log file handler rotating by size and age, compressing in the background.
+"""
+
+import gzip
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+
+# Suffix of a rotated file: the time of the rotation, a counter when several
+# happen within a second, and .gz once compressed.
+ROTATED_SUFFIX = re.compile(r"^\.(\d{8}-\d{6})(?:\.(\d+))?(?:\.gz)?$")
+
+# How often, in seconds, the handler checks whether another process rotated the file.
+REPLACED_CHECK_INTERVAL = 1.0
+
+
+class _Compressor:
+    """Background thread compressing rotated files and applying retention.
+
+    It starts with the first job. The thread is a daemon: a file whose
+    compression is cut short by the exit stays uncompressed, and the next
+    handler opened on that log compresses it.
+    """
+
+    def __init__(self):
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, handler, path=None) -> None:
+        """Compresses ``path`` (if given and the handler compresses), then
+        deletes the handler's rotated files beyond its retention limits."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-compressor",
+                                                daemon=True)
+                self._thread.start()
+        self._jobs.put((handler, path))
+
+    def _run(self) -> None:
+        while True:
+            handler, path = self._jobs.get()
+            try:
+                if path is not None and handler.compress:
+                    # Other processes sharing the log notice the rotation
+                    # within REPLACED_CHECK_INTERVAL; let their last writes land.
+                    try:
+                        wait = os.path.getmtime(path) + 2 * REPLACED_CHECK_INTERVAL - time.time()
+                    except FileNotFoundError:
+                        wait = 0    # already deleted by the retention
+                    if wait > 0:
+                        time.sleep(wait)
+                    compress_file(path)
+                handler.apply_retention()
+            except OSError as exc:
+                # Logging from here could end up in this very handler.
+                print(f"Log rotation of {handler.baseFilename} failed: {exc}", file=sys.stderr)
+
+    def join(self, timeout=None) -> bool:
+        """Waits until the jobs queued so far are done.
+
+        :return: False on timeout.
+        """
+        done = threading.Event()
+        self._jobs.put((_Marker(done), None))
+        return done.wait(timeout)
+
+
+class _Marker:
+    """Job setting an event, queued behind the others by ``_Compressor.join``."""
+
+    compress = False
+    baseFilename = "<marker>"
+
+    def __init__(self, event):
+        self.event = event
+
+    def apply_retention(self) -> None:
+        self.event.set()
+
+
+compressor = _Compressor()
+
+
+def compress_file(path) -> None:
+    """Replaces ``path`` by ``path.gz``, keeping its modification time.
+
+    The archive is written under a temporary name and renamed, so a crash never
+    leaves a truncated ``.gz`` behind; the original is removed afterwards.
+    """
+    target = f"{path}.gz"
+    partial = f"{target}.{os.getpid()}.tmp"
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as source, gzip.open(partial, "wb", compresslevel=6) as dest:
+            shutil.copyfileobj(source, dest, 1024 * 1024)
+        os.utime(partial, (stat.st_atime, stat.st_mtime))
+        os.replace(partial, target)
+    except FileNotFoundError:
+        # Deleted by the retention, or compressed by another process first.
+        if os.path.exists(partial):
+            os.remove(partial)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """File handler rotating by size and by age, with a retention limit.
+
+    The file is rotated before it grows past ``maxBytes`` or once it has been
+    written for ``maxAge`` seconds (0 disables either trigger). Rotated files are
+    named after the time of the rotation, ``sistema.log.20240131-235959``, and
+    gzipped by a background thread, so the thread logging never waits on the
+    compression. Rotated files beyond ``backupCount`` or beyond
+    ``retentionBytes`` in total, counting the current file, are deleted oldest
+    first (0 disables either limit).
+
+    Several processes can share the file: a process whose file was rotated by
+    another one reopens the new file instead of rotating it again.
+    """
+
+    # pylint: disable=invalid-name,too-many-arguments
+    def __init__(self, filename, mode="a", maxBytes=0, backupCount=0, encoding=None,
+                 delay=False, errors=None, maxAge=0, retentionBytes=0, compress=True):
+        self.maxAge = maxAge
+        self.retentionBytes = retentionBytes
+        self.compress = compress
+        self._opened_at = None
+        self._inode = None
+        self._checked_at = 0.0
+        super().__init__(filename, mode, maxBytes, backupCount, encoding, delay, errors)
+        # Finish what an earlier run left: uncompressed rotated files and retention.
+        leftovers = [path for path in self.rotated_files() if not path.endswith(".gz")]
+        for path in leftovers:
+            compressor.submit(self, path)
+        if not leftovers and (self.backupCount or self.retentionBytes):
+            compressor.submit(self)
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        if self._opened_at is None and stat.st_size:
+            # An existing file was started when the last rotation happened.
+            rotated = self.rotated_files()
+            self._opened_at = os.path.getmtime(rotated[-1]) if rotated else time.time()
+        elif self._inode != stat.st_ino:
+            self._opened_at = time.time()
+        self._inode = stat.st_ino
+        return stream
+
+    def rotated_files(self) -> list:
+        """Returns the paths of the rotated files of this log, oldest first."""
+        directory, name = os.path.split(self.baseFilename)
+        try:
+            entries = os.listdir(directory or ".")
+        except FileNotFoundError:
+            return []
+        rotated = []
+        for entry in entries:
+            match = entry.startswith(name) and ROTATED_SUFFIX.match(entry[len(name):])
+            if match:
+                order = (match.group(1), int(match.group(2) or 0))
+                rotated.append((order, os.path.join(directory, entry)))
+        return [path for _, path in sorted(rotated)]
+
+    def _replaced(self) -> bool:
+        """Tells whether the file was rotated (renamed) since it was opened."""
+        try:
+            return os.stat(self.baseFilename).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def shouldRollover(self, record):
+        if self.stream is not None:
+            now = time.monotonic()
+            if now - self._checked_at >= REPLACED_CHECK_INTERVAL:
+                self._checked_at = now
+                if self._replaced():
+                    self.stream.close()
+                    self.stream = self._open()
+        if super().shouldRollover(record):
+            return True
+        return bool(self.maxAge and self.stream.tell()
+                    and time.time() - self._opened_at >= self.maxAge)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        rotated = None
+        # Another process may have rotated the file just before.
+        if not self._replaced():
+            rotated = f"{self.baseFilename}.{time.strftime('%Y%m%d-%H%M%S')}"
+            candidate, counter = rotated, 0
+            while os.path.exists(candidate) or os.path.exists(f"{candidate}.gz"):
+                counter += 1
+                candidate = f"{rotated}.{counter}"
+            rotated = candidate
+            os.rename(self.baseFilename, rotated)
+        if not self.delay:
+            self.stream = self._open()
+        if rotated is not None:
+            compressor.submit(self, rotated)
+
+    def apply_retention(self) -> None:
+        """Deletes the oldest rotated files beyond ``backupCount`` and ``retentionBytes``."""
+        rotated = self.rotated_files()
+        sizes = {}
+        for path in rotated:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                sizes[path] = 0
+        try:
+            total = os.path.getsize(self.baseFilename) + sum(sizes.values())
+        except FileNotFoundError:
+            total = sum(sizes.values())
+        remaining = len(rotated)
+        for path in rotated:
+            over_count = self.backupCount and remaining > self.backupCount
+            over_size = self.retentionBytes and total > self.retentionBytes
+            if not (over_count or over_size):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            remaining -= 1
+            total -= sizes[path]
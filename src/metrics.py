@@ -0,0 +1,163 @@
+"""
+metrics.py
+In-process latency histograms and event counters, with a Prometheus endpoint.
+"""
+
+import bisect
+import time
+from contextlib import contextmanager
+
+from .http_server import HTTPServer, HTTPError
+
+# Upper bounds, in seconds, of the latency histogram buckets. The last bucket
+# (+Inf) is implicit.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram: memory stays constant however many values it sees."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value) -> None:
+        """Adds a value to its bucket."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimates the ``q`` quantile as the upper bound of the bucket holding it.
+
+        Values beyond the last bound report that bound. None without data.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+
+class Metrics:
+    """Per-stage latency histograms, named event counters and gauges.
+
+    Stages and events are fixed names chosen in the code, so the number of
+    series, and with it the memory used, is bounded. Gauges are functions read
+    when the metrics are reported.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.started = time.time()
+        self.stages = {}
+        self.events = {}
+        self.gauges = {}
+
+    def observe(self, stage, seconds) -> None:
+        """Records how long one execution of ``stage`` took."""
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram(self.bounds)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Times the ``with`` block as one execution of ``stage``, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def count(self, event, amount=1) -> None:
+        """Increments the counter of ``event``."""
+        self.events[event] = self.events.get(event, 0) + amount
+
+    def gauge(self, name, read) -> None:
+        """Registers ``read()`` as the current value of gauge ``name``."""
+        self.gauges[name] = read
+
+    def summary(self, extra=None) -> str:
+        """Formats the metrics as a short plain-text report.
+
+        :param extra: Mapping of section name to a dict of values appended at the end.
+        """
+        lines = [f"Uptime: {time.time() - self.started:.0f}s"]
+        if self.stages:
+            lines.append("Latency (count, avg, p50/p95/p99 upper bounds):")
+            for stage, h in sorted(self.stages.items()):
+                lines.append(
+                    f"  {stage}: {h.count}, {h.sum / h.count * 1000:.0f}ms, "
+                    f"{_ms(h.quantile(0.5))}/{_ms(h.quantile(0.95))}/{_ms(h.quantile(0.99))}"
+                )
+        if self.events:
+            lines.append("Events:")
+            lines.extend(f"  {event}: {value}" for event, value in sorted(self.events.items()))
+        if self.gauges:
+            lines.append("Gauges:")
+            lines.extend(f"  {name}: {_fmt(read())}" for name, read in sorted(self.gauges.items()))
+        for section, values in (extra or {}).items():
+            lines.append(f"{section}: " + ", ".join(f"{k}={_fmt(v)}" for k, v in values.items()))
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """Formats the metrics in the Prometheus text exposition format."""
+        lines = ["# TYPE bot_stage_seconds histogram"]
+        for stage, h in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(h.bounds, h.counts):
+                cumulative += count
+                lines.append(f'bot_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'bot_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'bot_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'bot_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        lines.append("# TYPE bot_events_total counter")
+        for event, value in sorted(self.events.items()):
+            lines.append(f'bot_events_total{{event="{event}"}} {value}')
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f"# TYPE bot_{name} gauge")
+            lines.append(f"bot_{name} {read()}")
+        lines.append("# TYPE bot_uptime_seconds gauge")
+        lines.append(f"bot_uptime_seconds {time.time() - self.started}")
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+
+def _fmt(value) -> str:
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+class MetricsServer(HTTPServer):
+    """Serves ``GET /metrics`` in the Prometheus text format.
+
+    Meant to be bound to localhost and scraped by a local agent; any other
+    path gets a 404.
+    """
+
+    name = "Metrics endpoint"
+
+    def __init__(self, registry, host="127.0.0.1", port=9464):
+        super().__init__(host, port)
+        self.registry = registry
+
+    async def handle(self, method, path, headers, body):
+        if path.split("?")[0] != "/metrics":
+            raise HTTPError(404)
+        if method != "GET":
+            raise HTTPError(405)
+        return 200, self.registry.prometheus().encode(), "text/plain; version=0.0.4; charset=utf-8"
+
+
+metrics = Metrics()
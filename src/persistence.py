@@ -0,0 +1,74 @@
+"""
+persistence.py
+Helpers for small pieces of state kept in memory and saved to disk periodically.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+def write_json_atomic(path, data) -> None:
+    """Writes JSON to a temporary file and renames it over ``path``.
+
+    Readers, and a crash halfway through, only ever see a complete file. The
+    temporary file is per process, so worker processes can save the same file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+class PeriodicFlush:
+    """Mixin that loads state on ``start``, calls ``flush`` every ``flush_interval``
+    seconds, and flushes once more on ``stop``.
+
+    Subclasses implement ``load`` and ``flush`` and set ``flush_interval``.
+    """
+
+    flush_interval = 60.0
+    _flusher = None
+
+    def load(self) -> None:
+        """Restores the persisted state."""
+
+    def flush(self) -> None:
+        """Persists the state."""
+        raise NotImplementedError
+
+    def _safe_flush(self) -> None:
+        try:
+            self.flush()
+        except OSError as e:
+            logger.error("Could not save %s state: %s", type(self).__name__, e)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._safe_flush()
+
+    async def start(self) -> None:
+        """Loads the persisted state and starts the periodic flush."""
+        self.load()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(
+                self._flush_loop(), name=f"{type(self).__name__}-flush"
+            )
+
+    async def stop(self) -> None:
+        """Stops the periodic flush and writes the final state."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        self._safe_flush()
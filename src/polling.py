@@ -0,0 +1,85 @@
+"""
+polling.py
+Adaptive polling schedule for Assistants runs.
+"""
+
+import random
+from collections import deque
+
+from .config import (
+    poll_min_interval, poll_max_interval, poll_backoff, poll_jitter,
+    poll_deadline, poll_min_deadline, poll_max_deadline, poll_window,
+)
+
+
+class AdaptivePoller:
+    """Chooses when to poll a run, learning from recent run durations.
+
+    Durations are kept per key (assistant and model) in a rolling window. The
+    first poll waits for the median of recent runs, when about half of them are
+    done. Later polls start a tenth of the median apart (at least
+    ``min_interval``) and back off geometrically up to ``max_interval``, with
+    random jitter so concurrent runs do not poll in lockstep. The deadline is
+    twice the 99th percentile, clamped to ``[min_deadline, max_deadline]``.
+    Without data the schedule starts polling after ``min_interval``.
+    """
+
+    def __init__(self, min_interval=poll_min_interval, max_interval=poll_max_interval,
+                 backoff=poll_backoff, jitter=poll_jitter, default_deadline=poll_deadline,
+                 min_deadline=poll_min_deadline, max_deadline=poll_max_deadline,
+                 window=poll_window):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.default_deadline = default_deadline
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.window = window
+        self._durations = {}
+
+    def record(self, key, duration) -> None:
+        """Records how long a run took; timed-out runs should record the deadline."""
+        samples = self._durations.get(key)
+        if samples is None:
+            samples = self._durations[key] = deque(maxlen=self.window)
+        samples.append(duration)
+
+    def quantile(self, key, q):
+        """Returns the ``q`` quantile of the recent durations, or None without data."""
+        samples = self._durations.get(key)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def deadline(self, key) -> float:
+        """Returns how long to wait for a run before giving up."""
+        p99 = self.quantile(key, 0.99)
+        if p99 is None:
+            return self.default_deadline
+        return min(self.max_deadline, max(self.min_deadline, 2 * p99))
+
+    def _jittered(self, interval) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def delays(self, key):
+        """Yields the successive sleeps before each poll, stopping at the deadline."""
+        deadline = self.deadline(key)
+        median = self.quantile(key, 0.5)
+        if median is None:
+            first = interval = self.min_interval
+        else:
+            first = min(max(median, self.min_interval), deadline)
+            interval = max(self.min_interval, median / 10)
+        max_interval = max(self.max_interval, interval)
+        elapsed = first
+        yield first
+        while elapsed < deadline:
+            delay = min(self._jittered(interval), deadline - elapsed)
+            elapsed += delay
+            yield delay
+            interval = min(max_interval, interval * self.backoff)
+
+
+adaptive_poller = AdaptivePoller()
@@ -0,0 +1,141 @@
+"""
+quota.py
+Per-user token-bucket quotas.
+"""
+
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from .config import (
+    user_quota_per_minute, user_quota_burst, quota_state_file, quota_flush_interval
+)
+from .persistence import PeriodicFlush, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaManager(PeriodicFlush):
+    """Token buckets keyed by ``telegram_id``.
+
+    Each bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per
+    second; a message costs one token. A bucket that has been idle long enough to
+    refill completely is indistinguishable from a new one, so it is evicted.
+    Buckets are kept in an ``OrderedDict`` ordered by last use, which makes both
+    the check and the eviction O(1) per message. Worker processes ``share`` a
+    table in shared memory instead, so a user's quota holds whichever worker
+    answers.
+    """
+
+    def __init__(self, rate=user_quota_per_minute / 60, burst=user_quota_burst,
+                 state_file=quota_state_file, flush_interval=quota_flush_interval):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = burst / rate
+        self.state_file = Path(state_file)
+        self.flush_interval = flush_interval
+        # telegram_id -> [tokens, time of last update]
+        self._buckets = OrderedDict()
+        self._shared = None
+
+    def share(self, table) -> None:
+        """Keeps the buckets in ``table``, a ``SharedTable`` with a ``"d"`` value
+        (the tokens) shared with the other worker processes."""
+        self._shared = table
+
+    def _evict_idle(self, now) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if now - bucket[1] < self.idle_ttl:
+                break
+            del buckets[key]
+
+    def check(self, telegram_id, now=None) -> float:
+        """Takes one token from the user's bucket.
+
+        :return: 0 if the message is allowed, otherwise the number of seconds
+            until a token becomes available.
+        """
+        now = time.time() if now is None else now
+        if self._shared is not None:
+            return self._check_shared(telegram_id, now)
+        self._evict_idle(now)
+        bucket = self._buckets.get(telegram_id)
+        if bucket is None:
+            bucket = self._buckets[telegram_id] = [self.burst, now]
+        else:
+            self._buckets.move_to_end(telegram_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def _check_shared(self, telegram_id, now) -> float:
+        table = self._shared
+        with table.lock:
+            entry = table.get(telegram_id, now)
+            if entry is None:
+                tokens = self.burst
+            else:
+                stamp, (tokens,) = entry
+                tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            allowed = tokens >= 1
+            table.put(telegram_id, (tokens - 1 if allowed else tokens,), now)
+        return 0.0 if allowed else (1 - tokens) / self.rate
+
+    def _entries(self) -> list:
+        """Returns ``[telegram_id, tokens, time of last update]`` for the live buckets."""
+        now = time.time()
+        if self._shared is not None:
+            with self._shared.lock:
+                return [[key, tokens, stamp] for key, stamp, (tokens,) in self._shared.items(now)]
+        self._evict_idle(now)
+        return [[key, tokens, stamp] for key, (tokens, stamp) in self._buckets.items()]
+
+    def __len__(self):
+        return len(self._entries()) if self._shared is not None else len(self._buckets)
+
+    def flush(self) -> None:
+        """Writes the non-idle buckets to the state file."""
+        write_json_atomic(self.state_file, self._entries())
+
+    def load(self) -> None:
+        """Restores the buckets saved by a previous run, if any."""
+        if not self.state_file.is_file():
+            return
+        try:
+            with open(self.state_file, encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error("Could not load quota state from %s: %s", self.state_file, e)
+            return
+        if self._shared is not None:
+            # Another worker may have loaded the file, and counted since.
+            now = time.time()
+            with self._shared.lock:
+                for key, tokens, stamp in entries:
+                    if now - stamp < self.idle_ttl and self._shared.get(key, now) is None:
+                        self._shared.put(key, (tokens,), now, stamp)
+            return
+        self._buckets = OrderedDict(
+            (key, [tokens, stamp]) for key, tokens, stamp in sorted(entries, key=lambda e: e[2])
+        )
+        self._evict_idle(time.time())
+
+
+def format_retry_after(seconds) -> str:
+    """Formats a retry-after delay for the user, rounded up to whole seconds."""
+    seconds = math.ceil(seconds)
+    if seconds < 60:
+        return f"{seconds} second{'s' if seconds != 1 else ''}"
+    minutes = math.ceil(seconds / 60)
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+quota_manager = QuotaManager()
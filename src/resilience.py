@@ -0,0 +1,201 @@
+"""
+resilience.py
+Retries with backoff and a circuit breaker around the OpenAI API calls.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+from openai import APIConnectionError, APIStatusError
+
+from .config import (
+    openai_max_attempts, retry_base_delay, retry_max_delay, retry_after_max,
+    breaker_failure_threshold, breaker_reset_timeout,
+)
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: the request may succeed if sent again later.
+TRANSIENT_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+def is_transient(error) -> bool:
+    """Tells whether ``error`` is a failure worth retrying (timeouts, connection
+    errors, rate limits and server errors) rather than a rejected request."""
+    if isinstance(error, APIConnectionError):  # Includes APITimeoutError.
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in TRANSIENT_STATUS
+
+
+def retry_after(error, now=None):
+    """Returns the delay in seconds requested by the ``Retry-After`` (or
+    ``retry-after-ms``) header of an API error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class CircuitBreaker:
+    """Fails fast while an API is down.
+
+    Closed, it lets calls through and counts consecutive failures. After
+    ``failure_threshold`` of them it opens: calls raise ``CircuitOpenError``
+    without being made. ``reset_timeout`` seconds later it is half-open and lets
+    a single probe call through; the probe's success closes it, a failure opens
+    it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=breaker_failure_threshold,
+                 reset_timeout=breaker_reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_call(self) -> None:
+        """Raises ``CircuitOpenError`` if the call must not be made."""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if self.clock() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit open")
+            self.state = self.HALF_OPEN
+            logger.info("Circuit half-open: probing the API.")
+        if self._probing:
+            raise CircuitOpenError("Circuit half-open, probe in progress")
+        self._probing = True
+
+    def record_success(self) -> None:
+        """Records a call that reached the API."""
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed: the API is answering again.")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """Lets another call probe when the probe was abandoned (cancelled)."""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """Records a transient failure."""
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                metrics.count("breaker_opened")
+                logger.error("Circuit open after %d failures; failing fast for %.0fs.",
+                             self.failures, self.reset_timeout)
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+
+class Resilient:
+    """Runs API calls through a circuit breaker, retrying transient failures.
+
+    Idempotent calls are attempted up to ``max_attempts`` times. Between
+    attempts it sleeps for the ``Retry-After`` the API asked for (at most
+    ``retry_after_max``) or, without one, for a random delay up to
+    ``base_delay * 2 ** attempt`` capped at ``max_delay`` ("full jitter", which
+    spreads out the retries of concurrent callers). Calls that are not
+    idempotent, like posting a message, are attempted once.
+
+    ``sleep`` and ``rng`` can be replaced to test fault sequences without
+    waiting.
+    """
+
+    def __init__(self, breaker=None, max_attempts=openai_max_attempts,
+                 base_delay=retry_base_delay, max_delay=retry_max_delay,
+                 max_retry_after=retry_after_max, sleep=asyncio.sleep, rng=random):
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.sleep = sleep
+        self.rng = rng
+
+    def backoff(self, attempt, error=None) -> float:
+        """Returns how long to wait before retry number ``attempt`` (from 0)."""
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            return min(requested, self.max_retry_after)
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, make_call, idempotent=True):
+        """Awaits ``make_call()``, retrying it on transient failures if idempotent.
+
+        :param make_call: Function returning a new coroutine for each attempt.
+        :raises CircuitOpenError: If the breaker is open.
+        """
+        attempts = self.max_attempts if idempotent else 1
+        for attempt in range(attempts):
+            try:
+                async with self.guarded():
+                    return await make_call()
+            except Exception as e:  # pylint: disable=broad-except
+                if attempt + 1 >= attempts or not is_transient(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                metrics.count("openai_retries")
+                logger.warning("Transient API error (%s); retry %d in %.2fs.", e, attempt + 1, delay)
+            await self.sleep(delay)
+        raise AssertionError("unreachable")
+
+    @asynccontextmanager
+    async def guarded(self):
+        """Runs the ``async with`` block as one call through the breaker, without
+        retrying it (used for streams).
+
+        Transient failures count against the breaker; any other outcome shows
+        the API is reachable. Exceptions propagate.
+        """
+        self.breaker.before_call()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+
+
+assistants_api = Resilient()
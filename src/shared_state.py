@@ -0,0 +1,95 @@
+"""
+shared_state.py
+Fixed-size hash table in shared memory, for per-user state of the worker processes.
+"""
+
+import multiprocessing
+import struct
+
+from .metrics import metrics
+
+# Slots examined for a key: the one it hashes to and the following ones.
+MAX_PROBE = 32
+
+
+class SharedTable:
+    """Maps non-zero integer keys (Telegram user ids) to fixed-size records.
+
+    Every slot holds ``(key, last use, *value)`` packed with ``struct``;
+    ``value_format`` describes the value, e.g. ``"d"`` for one float. A slot
+    unused for ``idle_ttl`` seconds is free again, so expiry needs no sweeping.
+    The table lives in a ``multiprocessing.RawArray`` created before the worker
+    processes start and passed to them, so every worker sees the same entries.
+
+    A key is looked for in ``MAX_PROBE`` consecutive slots. When all of them
+    are live, the least recently used entry is overwritten: with enough
+    ``slots`` for the active users this does not happen.
+
+    Methods do not lock: callers hold ``lock`` around each read-modify-write.
+    The lock is not released if its holder is killed, which would block the
+    other processes for good, so it must only be held for table operations.
+    """
+
+    def __init__(self, slots, value_format, idle_ttl, context=None):
+        context = context or multiprocessing.get_context("spawn")
+        self.slots = slots
+        self.idle_ttl = idle_ttl
+        self.format = "<qd" + value_format
+        self.record_size = struct.calcsize(self.format)
+        self.buffer = context.RawArray("c", slots * self.record_size)
+        self.lock = context.Lock()
+
+    def _read(self, index):
+        return struct.unpack_from(self.format, self.buffer, index * self.record_size)
+
+    def _find(self, key, now):
+        """Returns ``(slot of key or None, slot to store it in)``."""
+        free = oldest = None
+        oldest_used = float("inf")
+        for offset in range(MAX_PROBE):
+            index = (key + offset) % self.slots
+            slot_key, used, *_ = self._read(index)
+            live = slot_key != 0 and now - used < self.idle_ttl
+            if live and slot_key == key:
+                return index, index
+            if not live:
+                if free is None:
+                    free = index
+            elif used < oldest_used:
+                oldest, oldest_used = index, used
+        if free is None:
+            metrics.count("shared_state_evictions")
+        return None, free if free is not None else oldest
+
+    def get(self, key, now):
+        """Returns ``(last use, value tuple)`` for ``key``, or None."""
+        index, _ = self._find(key, now)
+        if index is None:
+            return None
+        record = self._read(index)
+        return record[1], record[2:]
+
+    def put(self, key, value, now, used=None) -> None:
+        """Stores ``value`` (a tuple) for ``key``, marking it used at ``used``
+        (by default ``now``, the current time)."""
+        _, index = self._find(key, now)
+        used = now if used is None else used
+        struct.pack_into(self.format, self.buffer, index * self.record_size, key, used, *value)
+
+    def pop(self, key, now) -> bool:
+        """Removes ``key``.
+
+        :return: True if it was stored.
+        """
+        index, _ = self._find(key, now)
+        if index is None:
+            return False
+        struct.pack_into("<q", self.buffer, index * self.record_size, 0)
+        return True
+
+    def items(self, now):
+        """Yields ``(key, last use, value)`` for the live entries."""
+        for index in range(self.slots):
+            key, used, *value = self._read(index)
+            if key != 0 and now - used < self.idle_ttl:
+                yield key, used, tuple(value)
@@ -0,0 +1,167 @@
+"""
+similarity.py
+Near-duplicate question matching over the stored Q&A history.
+
+Questions are normalized (see ``answer_cache.normalize_question``) and broken
+into character trigrams. A MinHash signature of the trigram set is split into
+bands; questions sharing a whole band land in the same LSH bucket. A lookup
+only compares the new question with the few records in its buckets, using the
+exact trigram Jaccard similarity, so its cost does not grow with the history.
+Everything runs locally in pure Python.
+"""
+
+import threading
+import zlib
+
+from .answer_cache import normalize_question, FALLBACK_ANSWERS
+from .config import similarity_threshold
+
+NGRAM = 3
+BANDS = 8
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+MAX_CANDIDATES = 32
+_EMPTY = 1 << 32
+
+
+def shingles(text) -> set:
+    """Returns the set of character n-grams of an already normalized question."""
+    padded = f" {text} "
+    if len(padded) <= NGRAM:
+        return {padded}
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+def signature(grams) -> list:
+    """MinHash signature using one-permutation hashing.
+
+    Each n-gram is hashed once; the hash picks a slot and the signature keeps the
+    minimum per slot. Slots no n-gram fell into borrow the value of the next
+    filled slot (circular densification), so short questions still get a full
+    signature without hashing every n-gram once per slot.
+    """
+    sig = [_EMPTY] * SIGNATURE_SIZE
+    for gram in grams:
+        h = zlib.crc32(gram.encode("utf-8"))
+        slot, value = h % SIGNATURE_SIZE, h // SIGNATURE_SIZE
+        if value < sig[slot]:
+            sig[slot] = value
+    if _EMPTY in sig and min(sig) != _EMPTY:
+        dense = sig[:]
+        for i, value in enumerate(sig):
+            if value == _EMPTY:
+                distance = 1
+                while sig[(i + distance) % SIGNATURE_SIZE] == _EMPTY:
+                    distance += 1
+                dense[i] = sig[(i + distance) % SIGNATURE_SIZE] + distance * _EMPTY
+        sig = dense
+    return sig
+
+
+def band_keys(grams) -> list:
+    """Returns one LSH bucket key per band for a set of n-grams."""
+    sig = signature(grams)
+    return [hash(tuple(sig[i * ROWS:(i + 1) * ROWS])) for i in range(BANDS)]
+
+
+def jaccard(first, second) -> float:
+    """Jaccard similarity of two sets."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class SimilarityIndex:
+    """Incremental MinHash/LSH index mapping questions to their latest answer."""
+
+    def __init__(self, threshold=similarity_threshold):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._questions = []
+        self._answers = []
+        self._ids = {}
+        # One dict per band: bucket key -> record id, or list of record ids.
+        self._buckets = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._questions)
+
+    def add(self, question, answer) -> None:
+        """Indexes a question/answer pair; a repeated question keeps the newest answer."""
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        with self._lock:
+            record_id = self._ids.get(normalized)
+            if record_id is not None:
+                self._answers[record_id] = answer
+                return
+            keys = band_keys(shingles(normalized))
+            record_id = self._ids[normalized] = len(self._questions)
+            self._questions.append(normalized)
+            self._answers.append(answer)
+            for buckets, key in zip(self._buckets, keys):
+                entry = buckets.get(key)
+                if entry is None:
+                    buckets[key] = record_id
+                elif isinstance(entry, list):
+                    entry.append(record_id)
+                else:
+                    buckets[key] = [entry, record_id]
+
+    def build(self, records, assistant) -> int:
+        """Indexes stored records, skipping those tagged with another assistant.
+
+        :return: Number of records indexed.
+        """
+        indexed = 0
+        for record in records:
+            if record.get("assistant_id") not in (assistant, None):
+                continue
+            if record.get("answer") in FALLBACK_ANSWERS:
+                continue
+            self.add(record.get("question") or "", record.get("answer"))
+            indexed += 1
+        return indexed
+
+    def lookup(self, question):
+        """Returns ``(answer, similarity)`` of the closest stored question at or
+        above the threshold, or None."""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        grams = shingles(normalized)
+        keys = band_keys(grams)
+        with self._lock:
+            record_id = self._ids.get(normalized)
+            if record_id is not None:
+                self.hits += 1
+                return self._answers[record_id], 1.0
+            votes = {}
+            for buckets, key in zip(self._buckets, keys):
+                entry = buckets.get(key)
+                if entry is None:
+                    continue
+                for candidate in entry if isinstance(entry, list) else (entry,):
+                    votes[candidate] = votes.get(candidate, 0) + 1
+            # Candidates sharing more bands are likelier matches; verify the best few.
+            candidates = sorted(votes, key=votes.get, reverse=True)[:MAX_CANDIDATES]
+            best, best_score = None, 0.0
+            for candidate in candidates:
+                score = jaccard(grams, shingles(self._questions[candidate]))
+                if score > best_score:
+                    best, best_score = candidate, score
+            if best is not None and best_score >= self.threshold:
+                self.hits += 1
+                return self._answers[best], best_score
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of indexed questions."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._questions)}
+
+
+similarity_index = SimilarityIndex()
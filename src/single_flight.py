@@ -0,0 +1,57 @@
+"""
+single_flight.py
+Coalescing of identical concurrent calls into one.
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share it.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it runs await the same task and get the same result or exception.
+    Each caller awaits through ``asyncio.shield``, so a caller that is
+    cancelled (e.g. by a timeout) leaves the call running for the others.
+    The key is released as soon as the call finishes; later callers start a
+    new one.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.joined = 0
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def _release(self, key, task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved: if every caller was cancelled nobody
+        # else will, and asyncio would log it as never retrieved.
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, call):
+        """Returns the result of ``call()``, or of the call already running for ``key``.
+
+        :param call: Function returning the coroutine to run; it is only called
+            when no call for ``key`` is in flight.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+            self.started += 1
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Returns how many calls were started and how many callers joined one."""
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._calls)}
+
+
+in_flight_answers = SingleFlight()
@@ -0,0 +1,198 @@
+"""
+sqlite_storage.py
+SQLite storage backend with a background batched writer.
+
+The database runs in WAL mode, so readers never block the writer and the file
+can be read by other processes while the bot is running. Writes are queued and
+committed by a single asyncio task in batches of ``batch_size`` records or every
+``batch_interval_ms`` milliseconds, whichever comes first; the commit itself runs
+in a worker thread so the event loop never waits on the disk.
+"""
+
+import asyncio
+import datetime
+import logging
+import sqlite3
+import threading
+
+from .config import sqlite_path, sqlite_batch_size, sqlite_batch_interval_ms
+from .storage import StorageBackend, make_record
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS qa (
+    id INTEGER PRIMARY KEY,
+    telegram_id INTEGER,
+    username TEXT,
+    question TEXT,
+    answer TEXT,
+    assistant_id TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS qa_telegram_id_timestamp ON qa (telegram_id, timestamp);
+CREATE INDEX IF NOT EXISTS qa_timestamp ON qa (timestamp);
+CREATE TABLE IF NOT EXISTS message_count (
+    date TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+_STOP = object()
+
+
+class SQLiteStorage(StorageBackend):
+    """Stores records and the daily message count in a SQLite database."""
+
+    def __init__(self, path=sqlite_path, batch_size=sqlite_batch_size,
+                 batch_interval_ms=sqlite_batch_interval_ms):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval_ms / 1000
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._count = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(qa)")}
+            if "assistant_id" not in columns:
+                # Databases created before records were tagged with the assistant.
+                conn.execute("ALTER TABLE qa ADD COLUMN assistant_id TEXT")
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
+        return self._conn
+
+    async def start(self) -> None:
+        """Loads the counter and starts the background writer."""
+        if self._writer is not None:
+            return
+        await asyncio.to_thread(self.get_message_count)
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop(), name="sqlite-writer")
+
+    async def stop(self) -> None:
+        """Commits everything still queued and closes the database."""
+        if self._writer is not None:
+            self._queue.put_nowait(_STOP)
+            await self._writer
+            self._writer = self._queue = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except sqlite3.Error as e:
+                logger.error("Could not write %d records to %s: %s", len(batch), self.path, e)
+
+    def _write_batch(self, batch) -> None:
+        records = [item[1] for item in batch if item[0] == "qa"]
+        counts = [item[1] for item in batch if item[0] == "count"]
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if records:
+                    conn.executemany(
+                        "INSERT INTO qa"
+                        " (telegram_id, username, question, answer, assistant_id, timestamp)"
+                        " VALUES (:telegram_id, :username, :question, :answer, :assistant_id,"
+                        " :timestamp)",
+                        records,
+                    )
+                if counts:
+                    # Only the latest value per day matters.
+                    conn.executemany(
+                        "INSERT INTO message_count (date, count) VALUES (?, ?)"
+                        " ON CONFLICT (date) DO UPDATE SET count = excluded.count",
+                        list(dict(counts).items()),
+                    )
+
+    def _enqueue(self, item) -> None:
+        if self._queue is not None:
+            self._queue.put_nowait(item)
+        else:
+            # Not started (e.g. offline tools): write through.
+            self._write_batch([item])
+
+    def save_qa(self, telegram_id, username, question, answer, assistant_id=None) -> None:
+        self._enqueue(("qa", make_record(telegram_id, username, question, answer, assistant_id)))
+
+    def get_message_count(self) -> dict:
+        if self._count is None:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT date, count FROM message_count ORDER BY date DESC LIMIT 1"
+                ).fetchone()
+            if row is None:
+                self._count = {"date": str(datetime.date.today()), "count": 0}
+            else:
+                self._count = {"date": row["date"], "count": row["count"]}
+        return dict(self._count)
+
+    def update_message_count(self, new_count, date=None) -> None:
+        date = date or str(datetime.date.today())
+        if self._count is None or date >= self._count["date"]:
+            self._count = {"date": date, "count": new_count}
+        self._enqueue(("count", (date, new_count)))
+
+    def get_user_history(self, telegram_id, limit=10) -> list:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT telegram_id, username, question, answer, assistant_id, timestamp FROM qa"
+                " WHERE telegram_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (telegram_id, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_user_messages(self, telegram_id, since=None) -> int:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM qa WHERE telegram_id = ? AND timestamp >= ?",
+                (telegram_id, since or ""),
+            ).fetchone()[0]
+
+    def iter_records(self):
+        # A separate connection keeps this long read out of the writer's way;
+        # in WAL mode it sees a consistent snapshot while new rows are added.
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(
+                "SELECT telegram_id, username, question, answer, assistant_id, timestamp"
+                " FROM qa ORDER BY id"
+            )
+            for row in cursor:
+                yield dict(row)
+        finally:
+            conn.close()
@@ -1,28 +1,349 @@
 """
 storage.py
-Handles storing and retrieving questions/answers
+Handles storing and retrieving questions/answers.
+
+The history is an append-only JSON-lines file: one JSON object per line, written
+with a single ``write`` call. Saving a record costs the same no matter how long
+the history is, and a crash can at worst leave a truncated last line, which
+readers skip and ``compact`` removes.
+
+``StorageBackend`` is the interface behind ``utils.save_qa`` and the message
+counter. ``JSONStorage`` keeps the history in the JSON-lines log and is the
+default; ``STORAGE_BACKEND=sqlite`` selects ``sqlite_storage.SQLiteStorage``.
 """
 
+import asyncio
+import datetime
+import gzip
 import json
+import logging
+import os
+import shutil
+import time
+from abc import ABC, abstractmethod
 from pathlib import Path
 
-# Define the path to the Q&A file
-qa_file = Path("questions_answers.json")
-
-# Ensure the Q&A file exists
-if not qa_file.is_file():
-    with open(qa_file, "w") as file:
-        json.dump([], file)
-
-def save_qa(telegram_id, username, question, answer):
-    """Save question and answer pairs to a file along with user information."""
-    with open(qa_file, "r+") as file:
-        data = json.load(file)
-        data.append({
-            "telegram_id": telegram_id,
-            "username": username,
-            "question": question,
-            "answer": answer
-        })
-        file.seek(0)
-        json.dump(data, file, indent=4)
+from .persistence import write_json_atomic
+from .config import (
+    qa_log_file, qa_fsync_every, qa_fsync_interval, message_count_file, storage_backend
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QALog:
+    """Append-only JSON-lines log of question/answer records.
+
+    Once ``start`` ran, the fsyncs happen in a background task, in a thread, so
+    appending never waits on the disk: the task syncs every ``fsync_interval``
+    seconds, and right away when ``append`` reaches ``fsync_every`` records.
+    Without it (scripts with no event loop) ``append`` syncs inline.
+    """
+
+    def __init__(self, path, fsync_every=0, fsync_interval=0.0):
+        """
+        :param path: Path of the ``.jsonl`` file. It is created on the first append.
+        :param fsync_every: fsync after this many records (0 disables the count trigger).
+        :param fsync_interval: fsync when this many seconds passed since the last
+            fsync (0 disables the time trigger). With both triggers disabled the
+            data is left to the OS page cache, as ``json.dump`` used to do.
+        """
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._fd = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._syncer = None
+        self._wakeup = None
+        self._stopping = False
+
+    def _open(self):
+        if self._fd is None:
+            # O_APPEND makes every write land at the current end of the file,
+            # even with several writers, so records are never interleaved.
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return self._fd
+
+    def append(self, record: dict) -> None:
+        """Writes one record as a single line."""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        fd = self._open()
+        view = memoryview(line)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        self._unsynced += 1
+        if self._syncer is not None:
+            if self.fsync_every and self._unsynced >= self.fsync_every:
+                self._wakeup.set()
+        elif self._should_sync():
+            self.sync()
+
+    def _should_sync(self) -> bool:
+        if self.fsync_every and self._unsynced >= self.fsync_every:
+            return True
+        if self.fsync_interval and time.monotonic() - self._last_sync >= self.fsync_interval:
+            return True
+        return False
+
+    def sync(self) -> None:
+        """Forces the records written so far to disk."""
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    async def start(self) -> None:
+        """Starts the background fsync, if a trigger is set."""
+        if self._syncer is None and (self.fsync_every or self.fsync_interval):
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._syncer = asyncio.create_task(self._sync_loop(), name="qa-log-fsync")
+
+    async def _sync_loop(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.fsync_interval or None)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Taken here, on the event loop, as append counts there too.
+            pending, self._unsynced = self._unsynced, 0
+            self._last_sync = time.monotonic()
+            if pending and self._fd is not None:
+                try:
+                    await asyncio.to_thread(os.fsync, self._fd)
+                except OSError as e:
+                    logger.error("Could not fsync %s: %s", self.path, e)
+
+    async def stop(self) -> None:
+        """Stops the background fsync, after a last one, and closes the file."""
+        if self._syncer is not None:
+            # Not cancelled: an fsync running in its thread must end before close.
+            self._stopping = True
+            self._wakeup.set()
+            await self._syncer
+            self._syncer = None
+        self.close()
+
+    def close(self) -> None:
+        """Syncs pending records and closes the file."""
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+
+
+def iter_records(path=qa_log_file):
+    """Yields the records of a JSON-lines file one at a time, skipping broken lines."""
+    path = Path(path)
+    if not path.is_file():
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def load_records(path):
+    """Yields the records of a history file, either a legacy JSON array or JSON lines."""
+    path = Path(path)
+    if not path.is_file():
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        head = file.read(1024).lstrip()
+    if head.startswith("["):
+        with open(path, "r", encoding="utf-8") as file:
+            yield from json.load(file)
+    else:
+        yield from iter_records(path)
+
+
+def migrate_json_array(source, destination=qa_log_file) -> int:
+    """Converts a legacy ``questions_answers.json`` array into the JSON-lines log.
+
+    The migrated records are placed before any record already in the destination
+    and the source is renamed to ``<name>.migrated`` so the migration runs once.
+
+    :return: Number of migrated records.
+    """
+    source, destination = Path(source), Path(destination)
+    with open(source, "r", encoding="utf-8") as file:
+        records = json.load(file)
+
+    tmp_path = destination.with_name(destination.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if destination.is_file():
+            with open(destination, "r", encoding="utf-8") as existing:
+                shutil.copyfileobj(existing, out)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, destination)
+    source.rename(source.with_name(source.name + ".migrated"))
+    return len(records)
+
+
+def compact(path=qa_log_file):
+    """Rewrites the log without blank or corrupted lines.
+
+    Meant to be run offline, while the bot is stopped.
+
+    :return: Tuple ``(kept, dropped)`` with the number of lines of each kind.
+    """
+    path = Path(path)
+    kept = dropped = 0
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(path, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as out:
+        for line in src:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                dropped += 1
+                continue
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            kept += 1
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+    return kept, dropped
+
+
+def rotate(path=qa_log_file, max_bytes=0, compress=False):
+    """Moves the log aside to ``<stem>.<timestamp>.jsonl[.gz]`` so a new one is started.
+
+    Meant to be run offline, while the bot is stopped.
+
+    :param max_bytes: Only rotate when the log is at least this large (0 always rotates).
+    :param compress: Gzip the rotated file.
+    :return: Path of the rotated file, or None when nothing was rotated.
+    """
+    path = Path(path)
+    if not path.is_file() or path.stat().st_size < max_bytes:
+        return None
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    rotated = path.with_name(f"{path.stem}.{stamp}{path.suffix}")
+    os.replace(path, rotated)
+    if compress:
+        gz_path = rotated.with_name(rotated.name + ".gz")
+        with open(rotated, "rb") as src, gzip.open(gz_path, "wb") as out:
+            shutil.copyfileobj(src, out)
+        rotated.unlink()
+        rotated = gz_path
+    return rotated
+
+
+def make_record(telegram_id, username, question, answer, assistant_id=None) -> dict:
+    """Builds a question/answer record stamped with the current local time."""
+    return {
+        "telegram_id": telegram_id,
+        "username": username,
+        "question": question,
+        "answer": answer,
+        "assistant_id": assistant_id,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+class StorageBackend(ABC):
+    """Interface for storing question/answer records and the daily message count."""
+
+    async def start(self) -> None:
+        """Starts background work, if any. Called once the event loop runs."""
+
+    async def stop(self) -> None:
+        """Flushes pending writes and releases resources."""
+
+    @abstractmethod
+    def save_qa(self, telegram_id, username, question, answer, assistant_id=None) -> None:
+        """Stores a question/answer record."""
+
+    @abstractmethod
+    def get_message_count(self) -> dict:
+        """Returns ``{"date": ..., "count": ...}`` for the last day that was counted."""
+
+    @abstractmethod
+    def update_message_count(self, new_count, date=None) -> None:
+        """Stores the message count of ``date`` (ISO date, today by default)."""
+
+    @abstractmethod
+    def get_user_history(self, telegram_id, limit=10) -> list:
+        """Returns the user's latest ``limit`` records, newest first."""
+
+    @abstractmethod
+    def count_user_messages(self, telegram_id, since=None) -> int:
+        """Counts the user's records, optionally only those at or after ``since`` (ISO date)."""
+
+    @abstractmethod
+    def iter_records(self):
+        """Yields every stored record, oldest first, without loading them all."""
+
+
+class JSONStorage(StorageBackend):
+    """Stores records in the JSON-lines log and the counter in a small JSON file."""
+
+    def __init__(self, qa_path=qa_log_file, count_path=message_count_file,
+                 fsync_every=qa_fsync_every, fsync_interval=qa_fsync_interval):
+        self.qa_log = QALog(qa_path, fsync_every, fsync_interval)
+        self.count_path = Path(count_path)
+
+    async def start(self) -> None:
+        await self.qa_log.start()
+
+    async def stop(self) -> None:
+        await self.qa_log.stop()
+
+    def save_qa(self, telegram_id, username, question, answer, assistant_id=None) -> None:
+        self.qa_log.append(make_record(telegram_id, username, question, answer, assistant_id))
+
+    def get_message_count(self) -> dict:
+        if not self.count_path.exists():
+            return {"date": str(datetime.date.today()), "count": 0}
+        with open(self.count_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def update_message_count(self, new_count, date=None) -> None:
+        date = date or str(datetime.date.today())
+        write_json_atomic(self.count_path, {"date": date, "count": new_count})
+
+    def get_user_history(self, telegram_id, limit=10) -> list:
+        history = [r for r in iter_records(self.qa_log.path) if r.get("telegram_id") == telegram_id]
+        return history[::-1][:limit]
+
+    def count_user_messages(self, telegram_id, since=None) -> int:
+        return sum(
+            1 for r in iter_records(self.qa_log.path)
+            if r.get("telegram_id") == telegram_id
+            and (since is None or r.get("timestamp", "") >= since)
+        )
+
+    def iter_records(self):
+        return iter_records(self.qa_log.path)
+
+
+def create_storage(backend=storage_backend) -> StorageBackend:
+    """Creates the storage backend named in the configuration."""
+    if backend == "json":
+        return JSONStorage()
+    if backend == "sqlite":
+        from .sqlite_storage import SQLiteStorage  # pylint: disable=import-outside-toplevel
+        return SQLiteStorage()
+    raise ValueError(f"Unknown storage backend: {backend!r}")
+
+
+_storage = None
+
+
+def get_storage() -> StorageBackend:
+    """Returns the process-wide storage backend, creating it on first use."""
+    global _storage  # pylint: disable=global-statement
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
@@ -0,0 +1,139 @@
+"""
+streaming.py
+Progressive delivery of a streamed answer through throttled Telegram edits.
+"""
+
+import asyncio
+import logging
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from .config import stream_edit_interval
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+PLACEHOLDER = "…"
+# Times an edit is retried after Telegram asks to wait (RetryAfter).
+EDIT_RETRIES = 2
+
+
+def split_point(text, limit=TELEGRAM_MESSAGE_LIMIT) -> int:
+    """Returns where to cut ``text`` so the first part fits in one message,
+    preferring a line break, then a space, over cutting a word."""
+    if len(text) <= limit:
+        return len(text)
+    for separator in ("\n", " "):
+        cut = text.rfind(separator, limit // 2, limit)
+        if cut != -1:
+            return cut + 1
+    return limit
+
+
+class StreamingReply:
+    """Shows an answer while it is being generated.
+
+    A placeholder message is sent right away and then edited as text arrives.
+    Edits are coalesced: at most one every ``edit_interval`` seconds, carrying
+    all the text received so far, which keeps the bot under Telegram's edit
+    rate limits. Text beyond the 4096-character message limit continues in a
+    new message. If Telegram keeps failing, the chat keeps the text shown so
+    far: the answer is complete for the caller all the same.
+    """
+
+    def __init__(self, bot, chat_id, edit_interval=stream_edit_interval):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.text = ""
+        self._message_id = None
+        self._offset = 0          # Start of the text shown in the current message.
+        self._shown = ""          # What the current message displays.
+        self._changed = asyncio.Event()
+        self._flusher = None
+
+    async def start(self) -> None:
+        """Sends the placeholder message."""
+        message = await self.bot.send_message(chat_id=self.chat_id, text=PLACEHOLDER)
+        self._message_id = message.message_id
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def feed(self, delta) -> None:
+        """Appends streamed text; it is shown with the next edit."""
+        if delta:
+            self.text += delta
+            self._changed.set()
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_edit = 0.0
+        while True:
+            await self._changed.wait()
+            wait = last_edit + self.edit_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._changed.clear()
+            await self._flush()
+            last_edit = loop.time()
+
+    async def _edit(self, text) -> None:
+        for attempt in range(EDIT_RETRIES + 1):
+            try:
+                with metrics.timer("telegram_edit"):
+                    await self.bot.edit_message_text(
+                        chat_id=self.chat_id, message_id=self._message_id, text=text
+                    )
+                break
+            except RetryAfter as e:
+                metrics.count("telegram_rate_limited")
+                if attempt == EDIT_RETRIES:
+                    raise
+                logger.info("Edit rate limited, waiting %ss.", e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                # Editing with unchanged text is rejected and harmless.
+                if "not modified" not in str(e).lower():
+                    raise
+                break
+        self._shown = text
+
+    async def _flush(self) -> None:
+        pending = self.text[self._offset:]
+        while len(pending) > TELEGRAM_MESSAGE_LIMIT:
+            cut = split_point(pending)
+            if pending[:cut] != self._shown:
+                await self._edit(pending[:cut])
+            self._offset += cut
+            pending = self.text[self._offset:]
+            message = await self.bot.send_message(
+                chat_id=self.chat_id, text=pending[:TELEGRAM_MESSAGE_LIMIT] or PLACEHOLDER
+            )
+            self._message_id = message.message_id
+            self._shown = pending[:TELEGRAM_MESSAGE_LIMIT]
+        if pending and pending != self._shown:
+            await self._edit(pending)
+
+    async def finish(self, error=None) -> None:
+        """Stops the periodic edits and shows the final text.
+
+        :param error: Message that replaces the text of the current message,
+            when the answer could not be completed.
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            except TelegramError as e:
+                metrics.count("stream_edit_errors")
+                logger.warning("Streaming edits to chat %s stopped: %s", self.chat_id, e)
+            self._flusher = None
+        if error is not None:
+            self.text = self.text[:self._offset] + error
+        try:
+            await self._flush()
+        except TelegramError as e:
+            metrics.count("stream_edit_errors")
+            logger.warning("Could not show the final text in chat %s: %s", self.chat_id, e)
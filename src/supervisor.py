@@ -0,0 +1,311 @@
+"""
+supervisor.py
+Multi-process mode: a supervisor shards the updates by chat across worker processes.
+
+The supervisor process fetches the updates, by polling or through the webhook,
+and puts each one on the queue of the worker that owns its chat. Every worker
+is a complete bot (handlers, work queue, caches and OpenAI client) running in
+its own process and event loop, so the bot uses as many cores as it has
+workers. A chat always goes to the same worker, which keeps its messages in
+order and its debounce batch in one place. What must be global lives outside
+the workers: the daily message count and the per-user quotas and conversation
+threads are shared memory (a user writes from private chats and groups, which
+may go to different workers), and the question/answer history is the
+append-only log or the SQLite database, both safe with several writers.
+
+Everything else stays per worker. In particular single-flight, the answer cache
+and the similarity index only deduplicate questions within one shard: the same
+question asked in two chats on different workers is answered twice.
+
+The shared state is guarded by ``multiprocessing`` locks, which are not
+released when their holder dies. A worker killed (SIGKILL, the OOM killer)
+while holding the lock of a ``SharedTable`` or of the daily count leaves every
+other worker blocked on it; such locks are only held for a few memory
+operations, never across I/O, which makes that window small, but only a
+restart of the whole bot recovers from it. A killed worker's update queue has
+the same problem and is replaced, see ``Supervisor``.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from .config import (
+    telegram_token, serving_mode, metrics_port, worker_processes, worker_restart_delay,
+    worker_drain_timeout, worker_shared_slots,
+)
+from .counter import message_counter
+from .quota import quota_manager
+from .shared_state import SharedTable
+from .thread_store import THREAD_ID_SIZE, thread_store
+from .webhook import run_webhook
+
+logger = logging.getLogger(__name__)
+
+# A worker that stayed up this long (seconds) is no longer crash-looping.
+STABLE_AFTER = 60
+
+
+def shard_for(chat_id, shards) -> int:
+    """Returns the worker, from 0, that handles ``chat_id``.
+
+    Chat ids are assigned sequentially by Telegram, so the remainder spreads
+    them evenly; negative group ids work too.
+    """
+    return chat_id % shards
+
+
+class SharedState:
+    """State the workers share, created by the supervisor before they start:
+    the ``[day, count]`` array of the daily count and the tables of the
+    per-user quotas and conversation threads."""
+
+    def __init__(self, context, slots=worker_shared_slots):
+        self.daily_count = context.Array("q", 2)
+        self.quotas = SharedTable(slots, "d", quota_manager.idle_ttl, context)
+        self.threads = SharedTable(slots, f"{THREAD_ID_SIZE}s", thread_store.idle_ttl, context)
+
+
+def prepare_worker(index, shared) -> None:
+    """Sets up the state of worker ``index`` before its application starts.
+
+    The daily count, quotas and threads live in ``shared`` for all workers;
+    each worker loads and saves them to the usual files, so they survive a
+    restart and a change of the number of workers. The metrics of worker
+    ``index`` are served on ``METRICS_PORT + index``.
+    """
+    from . import app  # pylint: disable=import-outside-toplevel
+    message_counter.share(shared.daily_count)
+    quota_manager.share(shared.quotas)
+    thread_store.share(shared.threads)
+    if app.metrics_server is not None:
+        app.metrics_server.port = metrics_port + index
+
+
+async def serve_worker(application, updates) -> None:
+    """Runs ``application`` on the updates the supervisor puts on ``updates``.
+
+    Mirrors ``Application.run_polling``. It returns when the supervisor puts
+    None, or on SIGTERM after taking what is left on the queue, once every
+    update received has been answered.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, RuntimeError):  # Windows
+        pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        while True:
+            try:
+                if stop.is_set():
+                    data = updates.get_nowait()
+                else:
+                    data = await asyncio.to_thread(updates.get, True, 0.5)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        if application.running:
+            # Answers every update already received before returning.
+            await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
+
+def run_worker(index, updates, shared) -> None:
+    """Entry point of a worker process."""
+    # Ctrl+C reaches the whole process group; the supervisor decides when
+    # workers stop, after it has stopped fetching updates.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # pylint: disable=import-outside-toplevel
+    from .app import build_application
+    from .bot import bootstrap
+    bootstrap()
+    prepare_worker(index, shared)
+    logger.info("Worker %d started.", index)
+    asyncio.run(serve_worker(build_application(), updates))
+
+
+class Supervisor:
+    """Starts ``workers`` worker processes, routes updates to them by chat and
+    restarts the ones that die.
+
+    ``target(index, updates, shared)`` is the function each worker process
+    runs; ``updates`` is its ``multiprocessing.Queue`` and ``shared`` the
+    ``SharedState`` of all workers. A dead worker's queue is replaced by a new
+    one, as a worker killed while reading would keep the queue's read lock
+    forever; the updates left on the old queue are moved to the new one when
+    its lock is free, and dropped otherwise. Updates routed while a worker is
+    down wait on the new queue for it to restart. Workers that keep
+    crashing are restarted after a delay doubling from ``restart_delay`` up to
+    64 times that.
+    """
+
+    def __init__(self, workers=worker_processes, target=run_worker,
+                 restart_delay=worker_restart_delay, drain_timeout=worker_drain_timeout):
+        context = multiprocessing.get_context("spawn")
+        self._context = context
+        self.workers = workers
+        self.target = target
+        self.restart_delay = restart_delay
+        self.drain_timeout = drain_timeout
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.shared = SharedState(context)
+        self.processes = [None] * workers
+        self.restarts = 0
+        self._started_at = [0.0] * workers
+        self._restart_at = [0.0] * workers
+        self._crashes = [0] * workers
+        self._watcher = None
+
+    def shard(self, update) -> int:
+        """Returns the worker for ``update``: by chat, or by user for updates
+        without a chat (e.g. inline queries)."""
+        chat = update.effective_chat
+        if chat is not None:
+            return shard_for(chat.id, self.workers)
+        user = update.effective_user
+        return shard_for(user.id, self.workers) if user is not None else 0
+
+    def dispatch(self, update) -> None:
+        """Puts ``update`` on the queue of its worker."""
+        self.queues[self.shard(update)].put(update.to_dict())
+
+    async def route(self, update, context) -> None:  # pylint: disable=unused-argument
+        """Handler of the supervisor's application: routes every update."""
+        self.dispatch(update)
+
+    def _spawn(self, index) -> None:
+        process = self._context.Process(
+            target=self.target, args=(index, self.queues[index], self.shared),
+            name=f"worker-{index}",
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = asyncio.get_running_loop().time()
+
+    async def start(self, application=None) -> None:  # pylint: disable=unused-argument
+        """Starts the workers and the watcher restarting them; usable as ``post_init``."""
+        for index in range(self.workers):
+            self._spawn(index)
+        self._watcher = asyncio.create_task(self._watch(), name="worker-watcher")
+        logger.info("Started %d worker processes.", self.workers)
+
+    async def _watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(0.5)
+            now = loop.time()
+            for index, process in enumerate(self.processes):
+                if process is None:
+                    if now >= self._restart_at[index]:
+                        self._spawn(index)
+                        self.restarts += 1
+                        logger.info("Worker %d restarted.", index)
+                    continue
+                if process.is_alive():
+                    if now - self._started_at[index] >= STABLE_AFTER:
+                        self._crashes[index] = 0
+                    continue
+                delay = self.restart_delay * 2 ** min(self._crashes[index], 6)
+                self._crashes[index] += 1
+                logger.error("Worker %d exited with code %s; restarting it in %.1fs.",
+                             index, process.exitcode, delay)
+                process.close()
+                self.processes[index] = None
+                self._restart_at[index] = now + delay
+                self._replace_queue(index)
+
+    def _replace_queue(self, index) -> None:
+        """Gives worker ``index`` a new queue, moving what is left on the old one."""
+        old = self.queues[index]
+        updates = self._context.Queue()
+        moved = 0
+        while True:
+            try:
+                # Times out when the dead worker kept the read lock; the
+                # updates still on the old queue are then lost.
+                data = old.get(True, 0.05)
+            except queue.Empty:
+                break
+            updates.put(data)
+            moved += 1
+        self.queues[index] = updates
+        old.cancel_join_thread()
+        old.close()
+        if moved:
+            logger.info("Moved %d pending updates to worker %d's new queue.", moved, index)
+
+    async def stop(self, application=None) -> None:  # pylint: disable=unused-argument
+        """Lets the workers answer what they have and stops them; usable as
+        ``post_shutdown``. Workers still busy after ``drain_timeout`` seconds
+        are terminated."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        for updates in self.queues:
+            updates.put(None)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, max(0.0, deadline - loop.time()))
+            if process.is_alive():
+                logger.warning("Worker %d still busy after %.0fs; terminating it.",
+                               index, self.drain_timeout)
+                process.terminate()
+                await asyncio.to_thread(process.join)
+            process.close()
+            self.processes[index] = None
+        for updates in self.queues:
+            # A terminated worker may have left updates unread; don't wait to
+            # flush them into its pipe.
+            updates.cancel_join_thread()
+            updates.close()
+        logger.info("Worker processes stopped.")
+
+
+def build_application(supervisor) -> Application:
+    """Returns the supervisor's application: it only fetches updates and
+    routes them, while the workers answer them."""
+    application = (
+        Application.builder()
+        .token(telegram_token)
+        .post_init(supervisor.start)
+        .post_shutdown(supervisor.stop)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, supervisor.route))
+    return application
+
+
+def run_supervisor(workers=worker_processes) -> None:
+    """Blocking entry point of the multi-process mode."""
+    application = build_application(Supervisor(workers))
+    if serving_mode == "webhook":
+        logger.info("Serving updates through the webhook with %d workers...", workers)
+        run_webhook(application)
+    else:
+        logger.info("Polling for messages with %d workers...", workers)
+        application.run_polling()
@@ -0,0 +1,156 @@
+"""
+thread_store.py
+Persistent mapping from Telegram users to their OpenAI conversation thread.
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from .config import thread_store_file, thread_idle_ttl, thread_flush_interval
+from .persistence import PeriodicFlush, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Room for a thread id in the shared table; OpenAI's are 31 characters.
+THREAD_ID_SIZE = 64
+
+
+class ThreadStore(PeriodicFlush):
+    """Keeps each user's ``thread_id`` in memory and saves the map periodically.
+
+    Entries are ordered by last use; users idle for longer than ``idle_ttl``
+    seconds lose their mapping and start a fresh thread on their next message.
+    Worker processes ``share`` a table in shared memory instead, so a user
+    keeps one thread whichever worker answers.
+    """
+
+    def __init__(self, path=thread_store_file, idle_ttl=thread_idle_ttl,
+                 flush_interval=thread_flush_interval):
+        self.path = Path(path)
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        # telegram_id -> [thread_id, time of last use]
+        self._threads = OrderedDict()
+        self._dirty = False
+        self._shared = None
+
+    def share(self, table) -> None:
+        """Keeps the map in ``table``, a ``SharedTable`` with a
+        ``f"{THREAD_ID_SIZE}s"`` value shared with the other worker processes."""
+        self._shared = table
+
+    def __len__(self):
+        if self._shared is not None:
+            return len(self._entries())
+        return len(self._threads)
+
+    def _expire_idle(self, now) -> None:
+        threads = self._threads
+        while threads:
+            key, entry = next(iter(threads.items()))
+            if now - entry[1] < self.idle_ttl:
+                break
+            del threads[key]
+            self._dirty = True
+
+    def __contains__(self, telegram_id):
+        if self._shared is not None:
+            with self._shared.lock:
+                return self._shared.get(telegram_id, time.time()) is not None
+        entry = self._threads.get(telegram_id)
+        return entry is not None and time.time() - entry[1] < self.idle_ttl
+
+    def get(self, telegram_id, now=None):
+        """Returns the user's thread id and marks it used, or None if there is none."""
+        now = time.time() if now is None else now
+        if self._shared is not None:
+            with self._shared.lock:
+                entry = self._shared.get(telegram_id, now)
+                if entry is None:
+                    return None
+                self._shared.put(telegram_id, entry[1], now)
+            self._dirty = True
+            return entry[1][0].rstrip(b"\0").decode()
+        self._expire_idle(now)
+        entry = self._threads.get(telegram_id)
+        if entry is None:
+            return None
+        entry[1] = now
+        self._threads.move_to_end(telegram_id)
+        self._dirty = True
+        return entry[0]
+
+    def set(self, telegram_id, thread_id, now=None) -> None:
+        """Associates a thread with the user."""
+        now = time.time() if now is None else now
+        self._dirty = True
+        if self._shared is not None:
+            encoded = thread_id.encode()
+            if len(encoded) > THREAD_ID_SIZE:
+                logger.warning("Thread id %s is too long to share; not kept.", thread_id)
+                return
+            with self._shared.lock:
+                self._shared.put(telegram_id, (encoded,), now)
+            return
+        self._threads[telegram_id] = [thread_id, now]
+        self._threads.move_to_end(telegram_id)
+
+    def reset(self, telegram_id) -> bool:
+        """Forgets the user's thread so the next message starts a new one.
+
+        :return: True if the user had a thread.
+        """
+        self._dirty = True
+        if self._shared is not None:
+            with self._shared.lock:
+                return self._shared.pop(telegram_id, time.time())
+        return self._threads.pop(telegram_id, None) is not None
+
+    def _entries(self) -> list:
+        """Returns ``[telegram_id, thread_id, time of last use]`` for the live entries."""
+        now = time.time()
+        if self._shared is not None:
+            with self._shared.lock:
+                return [[key, value.rstrip(b"\0").decode(), stamp]
+                        for key, stamp, (value,) in self._shared.items(now)]
+        self._expire_idle(now)
+        return [[key, *entry] for key, entry in self._threads.items()]
+
+    def flush(self) -> None:
+        """Writes the map if it changed since the last flush."""
+        if not self._dirty:
+            return
+        write_json_atomic(self.path, self._entries())
+        self._dirty = False
+
+    def load(self) -> None:
+        """Restores the map saved by a previous run, if any."""
+        if not self.path.is_file():
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error("Could not load threads from %s: %s", self.path, e)
+            return
+        if self._shared is not None:
+            # Another worker may have loaded the file, and changed it since.
+            now = time.time()
+            with self._shared.lock:
+                for key, thread_id, stamp in entries:
+                    encoded = thread_id.encode()
+                    if (now - stamp < self.idle_ttl and len(encoded) <= THREAD_ID_SIZE
+                            and self._shared.get(key, now) is None):
+                        self._shared.put(key, (encoded,), now, stamp)
+            return
+        self._threads = OrderedDict(
+            (key, [thread_id, stamp])
+            for key, thread_id, stamp in sorted(entries, key=lambda e: e[2])
+        )
+        self._expire_idle(time.time())
+
+
+thread_store = ThreadStore()
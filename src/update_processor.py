@@ -0,0 +1,72 @@
+"""
+update_processor.py
+Update processor that runs different chats concurrently while keeping the
+updates of each chat in arrival order.
+"""
+
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently across chats and sequentially within a chat.
+
+    ``Application`` creates one task per update in the order they were fetched.
+    Each task first takes its chat's lock, which ``asyncio.Lock`` hands out in
+    FIFO order, and only then one of the ``max_concurrent_updates`` worker slots.
+    Updates waiting for their turn inside a busy chat therefore never hold a
+    slot that another chat could use.
+
+    With a ``debouncer`` (see ``debounce.MessageDebouncer``), a text message
+    that the debouncer merges into an earlier one of its chat is dropped, and
+    the earlier one holds its chat until the debouncer has settled its batch.
+    """
+
+    __slots__ = ("_workers", "_chat_locks", "_debouncer")
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int = 0,
+                 debouncer=None):
+        # The base semaphore bounds how many updates may be in flight (waiting
+        # for their chat or running); the workers semaphore bounds how many run.
+        super().__init__(max_pending_updates or max_concurrent_updates * 64)
+        self._workers = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self._debouncer = debouncer
+
+    @staticmethod
+    def _chat_key(update):
+        """Returns the key used to order updates, the chat id when there is one."""
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update, coroutine) -> None:
+        """Awaits the coroutine once the chat is free and a worker slot is available."""
+        key = self._chat_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+        if self._debouncer is not None and self._debouncer.absorb(key, update):
+            coroutine.close()
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if self._debouncer is not None:
+                    await self._debouncer.settle(key, update)
+                async with self._workers:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def initialize(self) -> None:
+        """Nothing to allocate."""
+
+    async def shutdown(self) -> None:
+        """Nothing to release."""
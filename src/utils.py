@@ -3,50 +3,35 @@ utils.py
 This file contains utility functions for the Telegram bot.
 """
 
-import json
-from pathlib import Path
-import datetime
-from .logs.config_logger import LoggerConfigurator
+import logging
+from .metrics import metrics
+from .storage import get_storage
 
-# Configuración del logger al inicio del script
-logger = LoggerConfigurator().configure()
+logger = logging.getLogger(__name__)
 
-# Paths to the files
-message_count_file = Path("C:/AppServ/www/telegram_openai_assistant/message_count.json")
-qa_file = Path("C:/AppServ/www/telegram_openai_assistant/questions_answers.json")
 
 def get_message_count():
     """Retrieve the current message count."""
-    if not message_count_file.exists():
-        return {"date": str(datetime.date.today()), "count": 0}
-    with open(message_count_file) as file:
-        return json.load(file)
+    return get_storage().get_message_count()
 
-def update_message_count(new_count):
-    """Update the message count in the file."""
+def update_message_count(new_count, date=None):
+    """Update the message count of ``date`` (today by default) in the configured storage backend."""
     try:
-        with open(message_count_file, 'w') as file:
-            json.dump({"date": str(datetime.date.today()), "count": new_count}, file)
+        get_storage().update_message_count(new_count, date)
     except PermissionError as e:
         logger.error(f"Permission denied: {e}")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
 
 
-def save_qa(telegram_id, username, question, answer):
+def save_qa(telegram_id, username, question, answer, assistant_id=None):
     """Save question and answer pairs to a file along with user information."""
     try:
-        with open(qa_file, 'r+') as file:
-            data = json.load(file)
-            data.append({
-                "telegram_id": telegram_id,
-                "username": username,
-                "question": question,
-                "answer": answer
-            })
-            file.seek(0)
-            json.dump(data, file, indent=4)
+        with metrics.timer("save_qa"):
+            get_storage().save_qa(telegram_id, username, question, answer, assistant_id)
     except PermissionError as e:
+        metrics.count("save_qa_errors")
         logger.error(f"Permission denied: {e}")
     except Exception as e:
+        metrics.count("save_qa_errors")
         logger.error(f"An error occurred: {e}")
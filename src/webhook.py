@@ -0,0 +1,139 @@
+"""
+webhook.py
+Webhook serving mode: Telegram pushes updates to a local HTTP listener.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from collections import OrderedDict
+
+from telegram import Update
+
+from .config import (
+    webhook_listen, webhook_port, webhook_path, webhook_url, webhook_secret_token,
+    webhook_max_connections, webhook_dedup_size,
+)
+from .http_server import HTTPServer, HTTPError
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer(HTTPServer):
+    """Receives updates on ``POST <path>`` and hands them to the application.
+
+    Requests must carry the ``X-Telegram-Bot-Api-Secret-Token`` header set with
+    the webhook, so only Telegram can inject updates. Telegram delivers an
+    update again when it does not get a 200 in time; the last ``dedup_size``
+    update ids are remembered and repeated deliveries are acknowledged without
+    being processed twice.
+    """
+
+    name = "Webhook"
+
+    def __init__(self, application, host=webhook_listen, port=webhook_port,
+                 path=webhook_path, secret_token=webhook_secret_token,
+                 dedup_size=webhook_dedup_size):
+        super().__init__(host, port)
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.dedup_size = dedup_size
+        self._seen = OrderedDict()
+
+    def is_duplicate(self, update_id) -> bool:
+        """Remembers ``update_id`` and tells whether it was already received."""
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        return False
+
+    async def handle(self, method, path, headers, body):
+        if path.split("?")[0] != self.path:
+            raise HTTPError(404)
+        if method != "POST":
+            raise HTTPError(405)
+        token = headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            metrics.count("webhook_unauthorized")
+            raise HTTPError(401)
+        try:
+            data = json.loads(body)
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            metrics.count("webhook_invalid")
+            raise HTTPError(400) from e
+        if update is None:
+            raise HTTPError(400)
+        if self.is_duplicate(update.update_id):
+            metrics.count("webhook_duplicates")
+            logger.info("Ignoring repeated delivery of update %s.", update.update_id)
+        else:
+            metrics.count("webhook_updates")
+            await self.application.update_queue.put(update)
+        return 200, b"", "text/plain"
+
+
+async def serve(application) -> None:
+    """Runs the application on the webhook until SIGINT or SIGTERM.
+
+    Mirrors ``Application.run_polling``: initializes the application, runs
+    ``post_init``, serves, and on the way out stops the application and runs
+    ``post_shutdown``. With ``WEBHOOK_URL`` set the webhook is registered with
+    Telegram; without it, updates can be POSTed to the listener directly, e.g.
+    behind a reverse proxy that registers the webhook or when replaying
+    recorded updates locally.
+    """
+    secret_token = webhook_secret_token
+    if not secret_token:
+        if not webhook_url:
+            raise RuntimeError("WEBHOOK_SECRET_TOKEN is required when WEBHOOK_URL is not set.")
+        # We register the webhook ourselves, so any fresh secret will do.
+        secret_token = secrets.token_urlsafe(32)
+    server = WebhookServer(application, secret_token=secret_token)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):  # Windows
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + webhook_path,
+                secret_token=secret_token,
+                max_connections=webhook_max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info("Webhook registered at %s%s", webhook_url.rstrip("/"), webhook_path)
+        await stop.wait()
+    finally:
+        logger.info("Stopping the webhook...")
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
+
+def run_webhook(application) -> None:
+    """Blocking entry point, the webhook counterpart of ``run_polling``."""
+    try:
+        asyncio.run(serve(application))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,105 @@
+"""
+work_queue.py
+Bounded queue in front of the assistant with admission control and load shedding.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from .config import max_concurrent_updates, work_queue_max_depth, work_queue_deadline
+
+
+class Overloaded(Exception):
+    """Raised when a message is shed instead of being answered.
+
+    ``reason`` is "full" when the queue was at its maximum depth on arrival and
+    "stale" when the message waited past its deadline.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class WorkQueue:
+    """Lets at most ``workers`` messages be answered at once, in arrival order.
+
+    Up to ``max_depth`` more messages wait in a FIFO; beyond that new messages
+    are rejected on arrival, so memory and waiting time stay bounded however
+    slow the assistant gets. A message whose turn comes more than ``deadline``
+    seconds after it entered the queue is dropped without contacting OpenAI:
+    its user has most likely given up, and answering it would only delay fresh
+    ones. The time is measured on the event loop's monotonic clock, not from
+    Telegram's send date, whose clock and 1 s resolution are not ours and which
+    would also count the wait behind the chat's previous message.
+    """
+
+    def __init__(self, workers=max_concurrent_updates, max_depth=work_queue_max_depth,
+                 deadline=work_queue_deadline):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.deadline = deadline
+        self.active = 0
+        self._waiters = deque()
+        self.shed = {"full": 0, "stale": 0}
+
+    @property
+    def depth(self) -> int:
+        """Number of messages waiting for a worker."""
+        return len(self._waiters)
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        return Overloaded(reason)
+
+    @asynccontextmanager
+    async def slot(self, queued_at=None):
+        """Holds a worker for the ``async with`` block.
+
+        :param queued_at: When the message entered the queue, in event loop time
+            (``loop.time()``); the deadline counts from there. Defaults to now.
+        :raises Overloaded: If the message is shed.
+        """
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time() if queued_at is None else queued_at
+        if self.active >= self.workers or self._waiters:
+            if len(self._waiters) >= self.max_depth:
+                raise self._shed("full")
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Handed a worker just as we were cancelled: pass it on.
+                    self._release()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        else:
+            self.active += 1
+        try:
+            if loop.time() - queued_at > self.deadline:
+                raise self._shed("stale")
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        # The worker goes straight to the next waiter, if any, so ``active``
+        # only drops when nobody is waiting.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        """Returns the current load and how many messages were shed."""
+        return {"active": self.active, "waiting": self.depth, "shed_full": self.shed["full"],
+                "shed_stale": self.shed["stale"]}
+
+
+work_queue = WorkQueue()
@@ -0,0 +1,60 @@
+"""
+tests/test_handlers.py
+Concurrency of the assistant calls against a fake OpenAI client.
+"""
+
+import asyncio
+import time
+
+from src import handlers
+from src.bench.fakes import FakeAssistants, FakeBot, FakeOpenAI, Latency
+from src.single_flight import in_flight_answers
+
+RUN_LATENCY = 0.5
+
+
+def elapsed(api, *questions) -> float:
+    """Answers the questions concurrently and returns the wall time taken."""
+
+    async def ask_all():
+        answers = await asyncio.gather(*(handlers.get_answer(q) for q in questions))
+        assert answers == [api.answer] * len(questions)
+
+    started = time.monotonic()
+    asyncio.run(ask_all())
+    return time.monotonic() - started
+
+
+def test_concurrent_messages_finish_in_about_the_time_of_one(monkeypatch):
+    api = FakeAssistants(api_latency=Latency(0.01), run_latency=Latency(RUN_LATENCY))
+    monkeypatch.setattr(handlers, "client", FakeOpenAI(api))
+
+    one = elapsed(api, "Question 0?")
+    many = elapsed(api, *(f"Question {i}?" for i in range(1, 21)))
+
+    assert one >= RUN_LATENCY
+    # Run one after the other, 20 runs would take 20 times as long.
+    assert many < 2 * one
+    assert api.calls["runs.create"] == 21
+
+
+def test_streamed_run_past_the_deadline_is_cancelled_for_every_chat(monkeypatch):
+    api = FakeAssistants(api_latency=Latency(0.01), run_latency=Latency(5))
+    monkeypatch.setattr(handlers, "client", FakeOpenAI(api))
+    monkeypatch.setattr(handlers, "poll_max_deadline", 0.3)
+
+    async def ask_twice():
+        bot = FakeBot(Latency(0.01))
+        await bot.initialize()
+        answers = await asyncio.gather(
+            handlers.stream_answer("Shared question?", None, bot, 1),
+            handlers.stream_answer("Shared question?", None, bot, 2),
+        )
+        await asyncio.sleep(0.1)
+        # Checked before asyncio.run cancels whatever is left.
+        assert handlers.flight_key("Shared question?") not in in_flight_answers
+        assert api.calls["runs.cancel"] == 1
+        return answers
+
+    assert asyncio.run(ask_twice()) == ["Sorry, the response took too long."] * 2
+    assert api.calls["runs.stream"] == 1
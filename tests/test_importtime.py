@@ -0,0 +1,21 @@
+"""
+tests/test_importtime.py
+Import-time budgets of the entry modules, measured in fresh interpreters.
+"""
+
+import pytest
+
+from src.bench.importtime import BUDGETS, check
+
+
+@pytest.mark.parametrize("module", list(BUDGETS))
+def test_import_within_budget_without_writes_or_sdks(module):
+    budget, sdks = BUDGETS[module]
+    _, failures = check(module, budget, sdks)
+    assert not failures
+
+
+def test_check_reports_sdks_and_budget_overruns():
+    _, failures = check("src.app", 0, ("telegram",), runs=1)
+    assert failures[0].startswith("src.app took")
+    assert failures[1] == "src.app imports telegram"
@@ -0,0 +1,181 @@
+"""
+tests/test_resilience.py
+Deterministic fault sequences through the retries and the circuit breaker.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from openai import APIConnectionError, APIStatusError
+
+from src.resilience import CircuitBreaker, CircuitOpenError, Resilient, retry_after
+
+
+def status_error(status, retry_after_seconds=None):
+    """The exception the OpenAI client raises for an HTTP error response."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/threads")
+    headers = {} if retry_after_seconds is None else {"retry-after": str(retry_after_seconds)}
+    response = httpx.Response(status, headers=headers, request=request)
+    return APIStatusError(f"Error code: {status}", response=response, body=None)
+
+
+class Clock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MaxRng:
+    """Random source whose ``uniform`` always returns the upper bound."""
+
+    @staticmethod
+    def uniform(low, high):  # pylint: disable=unused-argument
+        return high
+
+
+class Script:
+    """API call failing with the given exceptions, in order, then answering "ok"."""
+
+    def __init__(self, *faults):
+        self.faults = list(faults)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+
+        async def attempt():
+            if self.faults:
+                fault = self.faults.pop(0)
+                if fault is not None:
+                    raise fault
+            return "ok"
+
+        return attempt()
+
+
+def make_resilient(clock=None, threshold=3, reset_timeout=30, **kwargs):
+    """Returns ``(resilient, sleeps)``: sleeping only records the delay."""
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    breaker = CircuitBreaker(threshold, reset_timeout, clock=clock or Clock())
+    options = {"max_attempts": 3, "base_delay": 0.5, "max_delay": 8, "max_retry_after": 30}
+    options.update(kwargs)
+    return Resilient(breaker, sleep=sleep, rng=MaxRng(), **options), sleeps
+
+
+def test_transient_errors_are_retried_with_exponential_backoff():
+    resilient, sleeps = make_resilient(threshold=10)
+    call = Script(APIConnectionError(request=None), status_error(503))
+    assert asyncio.run(resilient.call(call)) == "ok"
+    assert call.calls == 3
+    assert sleeps == [0.5, 1.0]
+    assert resilient.breaker.state == CircuitBreaker.CLOSED
+    assert resilient.breaker.failures == 0
+
+
+def test_backoff_is_capped():
+    resilient, _ = make_resilient()
+    assert resilient.backoff(10) == 8
+
+
+def test_retry_after_is_honoured_and_capped():
+    resilient, sleeps = make_resilient(threshold=10, max_retry_after=5)
+    call = Script(status_error(429, 2), status_error(429, 60))
+    assert asyncio.run(resilient.call(call)) == "ok"
+    assert sleeps == [2.0, 5]
+    assert retry_after(status_error(429, 2)) == 2.0
+
+
+def test_non_idempotent_calls_are_attempted_once():
+    resilient, sleeps = make_resilient()
+    call = Script(status_error(503))
+    with pytest.raises(APIStatusError):
+        asyncio.run(resilient.call(call, idempotent=False))
+    assert call.calls == 1
+    assert not sleeps
+
+
+def test_rejected_requests_are_not_retried_and_do_not_trip_the_breaker():
+    resilient, sleeps = make_resilient(threshold=1)
+    call = Script(status_error(400))
+    with pytest.raises(APIStatusError):
+        asyncio.run(resilient.call(call))
+    assert call.calls == 1
+    assert not sleeps
+    assert resilient.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_opens_fails_fast_probes_and_closes():
+    clock = Clock()
+    resilient, _ = make_resilient(clock, threshold=3, reset_timeout=30, max_attempts=1)
+    for _ in range(3):
+        with pytest.raises(APIStatusError):
+            asyncio.run(resilient.call(Script(status_error(503))))
+    assert resilient.breaker.state == CircuitBreaker.OPEN
+
+    call = Script()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilient.call(call))
+    assert call.calls == 0
+
+    clock.now = 30
+    assert asyncio.run(resilient.call(call)) == "ok"
+    assert call.calls == 1
+    assert resilient.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    clock = Clock()
+    resilient, _ = make_resilient(clock, threshold=1, reset_timeout=10, max_attempts=1)
+    with pytest.raises(APIStatusError):
+        asyncio.run(resilient.call(Script(status_error(502))))
+    clock.now = 10
+    with pytest.raises(APIConnectionError):
+        asyncio.run(resilient.call(Script(APIConnectionError(request=None))))
+    assert resilient.breaker.state == CircuitBreaker.OPEN
+    clock.now = 15
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilient.call(Script()))
+
+
+def test_half_open_breaker_lets_a_single_probe_through():
+    clock = Clock()
+    breaker = CircuitBreaker(1, 10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_is_released():
+    clock = Clock()
+    resilient, _ = make_resilient(clock, threshold=1, reset_timeout=10, max_attempts=1)
+    resilient.breaker.record_failure()
+    clock.now = 10
+
+    async def hang():
+        await asyncio.sleep(3600)
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(resilient.call(hang))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert asyncio.run(resilient.call(Script())) == "ok"
+    assert resilient.breaker.state == CircuitBreaker.CLOSED
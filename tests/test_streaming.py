@@ -0,0 +1,54 @@
+"""
+tests/test_streaming.py
+Telegram errors while streaming an answer into a chat.
+"""
+
+import asyncio
+
+from telegram.error import Forbidden, RetryAfter
+
+from src.bench.fakes import FakeObject
+from src.streaming import EDIT_RETRIES, StreamingReply
+
+
+class FailingBot:
+    """Bot whose sends succeed and whose edits always raise ``error``."""
+
+    def __init__(self, error):
+        self.error = error
+        self.edits = 0
+
+    async def send_message(self, chat_id, text):  # pylint: disable=unused-argument
+        return FakeObject(message_id=1)
+
+    async def edit_message_text(self, **kwargs):  # pylint: disable=unused-argument
+        self.edits += 1
+        raise self.error
+
+
+def stream(bot, error=None) -> str:
+    """Streams two fragments into a reply on ``bot`` and finishes it."""
+
+    async def scenario():
+        reply = StreamingReply(bot, chat_id=1, edit_interval=0)
+        await reply.start()
+        reply.feed("Hello")
+        await asyncio.sleep(0.05)
+        reply.feed(" world")
+        await reply.finish(error)
+        return reply.text
+
+    return asyncio.run(scenario())
+
+
+def test_rate_limited_edits_are_retried_a_bounded_number_of_times():
+    bot = FailingBot(RetryAfter(0))
+    assert stream(bot) == "Hello world"
+    # The flusher's edit and the final one, each tried 1 + EDIT_RETRIES times.
+    assert bot.edits == 2 * (1 + EDIT_RETRIES)
+
+
+def test_telegram_errors_do_not_escape_finish():
+    bot = FailingBot(Forbidden("bot was blocked by the user"))
+    assert stream(bot) == "Hello world"
+    assert stream(bot, error="Sorry.") == "Sorry."
@@ -0,0 +1,73 @@
+"""
+tests/test_supervisor.py
+Restarts of killed worker processes and the updates queued for them.
+"""
+
+import asyncio
+import functools
+import os
+import signal
+import time
+
+from src.supervisor import Supervisor
+
+
+def echo_worker(index, updates, shared, results=None):  # pylint: disable=unused-argument
+    """Worker process target: reports ``"ready"``, then every update it reads.
+    A ``"sleep"`` update makes it stop reading."""
+    results.put("ready")
+    while True:
+        data = updates.get()
+        if data is None:
+            return
+        if data == "sleep":
+            time.sleep(60)
+        results.put(data)
+
+
+def run(scenario) -> list:
+    """Runs ``scenario(supervisor, next_result)`` against one echo worker."""
+
+    async def main():
+        supervisor = Supervisor(1, restart_delay=0.1, drain_timeout=5)
+        results = supervisor._context.Queue()  # pylint: disable=protected-access
+        supervisor.target = functools.partial(echo_worker, results=results)
+
+        async def next_result():
+            return await asyncio.to_thread(results.get, True, 10)
+
+        await supervisor.start()
+        try:
+            assert await next_result() == "ready"
+            return await scenario(supervisor, next_result)
+        finally:
+            await supervisor.stop()
+
+    return asyncio.run(main())
+
+
+def test_worker_killed_while_reading_gets_updates_after_restart():
+    async def scenario(supervisor, next_result):
+        # Once its "ready" is written, the worker is blocked in get(),
+        # holding the queue's read lock.
+        await asyncio.sleep(0.5)
+        os.kill(supervisor.processes[0].pid, signal.SIGKILL)
+        assert await next_result() == "ready"
+        supervisor.queues[0].put({"update_id": 1})
+        return await next_result()
+
+    assert run(scenario) == {"update_id": 1}
+
+
+def test_updates_left_by_a_killed_worker_are_moved_in_order():
+    async def scenario(supervisor, next_result):
+        supervisor.queues[0].put("sleep")
+        await asyncio.sleep(0.5)
+        supervisor.queues[0].put({"update_id": 1})
+        supervisor.queues[0].put({"update_id": 2})
+        await asyncio.sleep(0.2)
+        os.kill(supervisor.processes[0].pid, signal.SIGKILL)
+        assert await next_result() == "ready"
+        return [await next_result(), await next_result()]
+
+    assert run(scenario) == [{"update_id": 1}, {"update_id": 2}]
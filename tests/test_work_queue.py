@@ -0,0 +1,35 @@
+"""
+tests/test_work_queue.py
+Admission and shedding of the work queue.
+"""
+
+import asyncio
+
+import pytest
+
+from src.work_queue import Overloaded, WorkQueue
+
+
+def test_message_waiting_past_the_deadline_is_shed():
+    async def scenario():
+        work_queue = WorkQueue(workers=1, max_depth=4, deadline=0.2)
+
+        async def hold():
+            async with work_queue.slot():
+                await asyncio.sleep(0.4)
+
+        async def wait_turn():
+            async with work_queue.slot():
+                pass
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await wait_turn()
+        await holder
+        return shed.value.reason, work_queue.stats()
+
+    reason, stats = asyncio.run(scenario())
+    assert reason == "stale"
+    assert stats == {"active": 0, "waiting": 0, "shed_full": 0, "shed_stale": 1}
+